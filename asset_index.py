@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+
+from PIL import Image
+
+INDEX_VERSION = 2
+IMAGE_EXTENSIONS = {"gif", "png", "jpg", "jpeg"}
+
+
+def simple_name(filename):
+    return filename.split(".")[0].lower()
+
+
+def describe_file(path):
+    """Type, dimensions, frame count and total duration of one asset."""
+    info = {"type": path.rsplit(".", 1)[-1].lower()}
+    if info["type"] not in IMAGE_EXTENSIONS:
+        return info
+    try:
+        with Image.open(path) as image:
+            info["width"], info["height"] = image.size
+            info["frames"] = getattr(image, "n_frames", 1)
+            duration = 0
+            if info["frames"] > 1:
+                for frame_index in range(info["frames"]):
+                    image.seek(frame_index)
+                    duration += image.info.get("duration", 100)
+            info["duration_ms"] = duration
+    except (OSError, ValueError) as e:
+        print(f"Could not index {path}: {e}")
+    return info
+
+
+class AssetIndex:
+    """Index of everything under images/, persisted to index_path.
+
+    refresh() lists every directory and stats every file, which is about what
+    os.walk costs, but only opens files that are new or whose mtime or size
+    changed. Dimensions, frame counts and durations therefore come from the
+    index instead of decoding the file on each command."""
+
+    def __init__(self, images_dir, index_path):
+        self.images_dir = images_dir
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.dirs = {}  # relative dir ("" for images/) -> {"subdirs", "files"}
+        self._load()
+        self.refresh()
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.dirs = data["dirs"]
+        except (OSError, ValueError, KeyError):
+            self.dirs = {}
+
+    def _save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"version": INDEX_VERSION, "dirs": self.dirs}, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Could not save asset index: {e}")
+
+    def refresh(self):
+        """Pick up files added, removed or modified since the last scan.
+        Returns True if anything changed."""
+        with self.lock:
+            dirs = {}
+            changed = self._scan_dir("", dirs)
+            changed = changed or dirs.keys() != self.dirs.keys()
+            self.dirs = dirs
+            if changed:
+                self._rebuild()
+                self._save()
+            elif not hasattr(self, "paths"):
+                self._rebuild()
+            return changed
+
+    def _scan_dir(self, rel_dir, dirs):
+        full_dir = os.path.join(self.images_dir, rel_dir)
+        old = self.dirs.get(rel_dir)
+        old_files = old["files"] if old is not None else {}
+        entry = {"subdirs": [], "files": {}}
+        changed = old is None
+        try:
+            with os.scandir(full_dir) as it:
+                dir_entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return True
+        for dir_entry in dir_entries:
+            if dir_entry.name.startswith("."):
+                continue
+            if dir_entry.is_dir():
+                entry["subdirs"].append(dir_entry.name)
+                continue
+            # Files rewritten in place (e.g. by scripts/downsize.py) keep the
+            # directory mtime, so each file is checked on its own
+            stat = dir_entry.stat()
+            previous = old_files.get(dir_entry.name)
+            if (
+                previous is not None
+                and previous["mtime_ns"] == stat.st_mtime_ns
+                and previous["size"] == stat.st_size
+            ):
+                entry["files"][dir_entry.name] = previous
+            else:
+                changed = True
+                info = describe_file(dir_entry.path)
+                info["mtime_ns"] = stat.st_mtime_ns
+                info["size"] = stat.st_size
+                entry["files"][dir_entry.name] = info
+        if old is not None and (
+            old["subdirs"] != entry["subdirs"] or old_files.keys() != entry["files"].keys()
+        ):
+            changed = True
+        dirs[rel_dir] = entry
+        for subdir in entry["subdirs"]:
+            changed = self._scan_dir(os.path.join(rel_dir, subdir), dirs) or changed
+        return changed
+
+    def _rebuild(self):
+        # Same shape Picture has always used: simple name -> full path, sorted
+        paths_unsorted = {}
+        assets = {}
+        all_subdirs = []
+        for rel_dir in sorted(self.dirs):
+            entry = self.dirs[rel_dir]
+            all_subdirs.extend(entry["subdirs"])
+            for filename, info in entry["files"].items():
+                name = simple_name(filename)
+                paths_unsorted[name] = os.path.join(self.images_dir, rel_dir, filename)
+                assets[name] = dict(info, name=name, dir=rel_dir, file=filename)
+        self.paths = {k: paths_unsorted[k] for k in sorted(paths_unsorted.keys())}
+        self.names = list(self.paths.keys())
+        self.assets = assets
+        self.all_subdirs = all_subdirs
+        root = self.dirs.get("", {"subdirs": [], "files": {}})
+        self.top_level = sorted(
+            [(name, True) for name in root["subdirs"]]
+            + [(name, False) for name in root["files"]]
+        )
+
+    def files_in(self, rel_dir):
+        """Filenames directly inside images/<rel_dir>."""
+        entry = self.dirs.get(rel_dir)
+        return list(entry["files"]) if entry is not None else []
+
+    def describe(self, name):
+        return self.assets.get(name)
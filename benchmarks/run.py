@@ -0,0 +1,266 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import zlib
+from pathlib import Path
+
+repo_root = Path(__file__).parent.parent
+images_dir = repo_root / "images"
+sys.path.append(str(repo_root))
+
+# No panel or emulator; set TOTEM_MATRIX_BACKEND=recorder to include drawing
+os.environ.setdefault("TOTEM_MATRIX_BACKEND", "null")
+
+# Picture's argument parser reads sys.argv, which holds our own arguments
+ARGV = sys.argv[:]
+sys.argv = sys.argv[:1]
+
+import metrics
+from canvas import art_canvas, render_canvas
+from frame_cache import decode_frames
+from picture import Picture, StoppableThread
+
+SUPPORTED_EXTENSIONS = [".gif", ".jpg", ".jpeg", ".png"]
+
+
+def summarize(samples):
+    """Timing samples in seconds as milliseconds."""
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1000,
+        "min_ms": samples[0] * 1000,
+    }
+
+
+def new_picture():
+    picture = Picture()
+    picture.process()
+    return picture
+
+
+def bench_startup(repeat):
+    """Picture() plus process(), with the asset index already on disk."""
+    new_picture()
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        new_picture()
+        samples.append(time.perf_counter() - started_at)
+    return summarize(samples)
+
+
+def bench_gif_decode_upload(picture, repeat):
+    """Decode (from the compiled archive if there is one) and upload every
+    asset in images/."""
+    per_file = {}
+    decode_total = upload_total = 0.0
+    for path in sorted(images_dir.rglob("*.*")):
+        if path.suffix.lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        decode_samples = []
+        upload_samples = []
+        for _ in range(repeat):
+            started_at = time.perf_counter()
+            frames, _ = decode_frames(str(path))
+            decode_samples.append(time.perf_counter() - started_at)
+            started_at = time.perf_counter()
+            picture.upload_frames(frames)
+            upload_samples.append(time.perf_counter() - started_at)
+        decode_ms = statistics.median(decode_samples) * 1000
+        upload_ms = statistics.median(upload_samples) * 1000
+        decode_total += decode_ms
+        upload_total += upload_ms
+        per_file[str(path.relative_to(images_dir))] = {
+            "frames": len(frames),
+            "decode_ms": decode_ms,
+            "upload_ms": upload_ms,
+        }
+    return {
+        "files": len(per_file),
+        "decode_total_ms": decode_total,
+        "upload_total_ms": upload_total,
+        "per_file": per_file,
+    }
+
+
+def bench_render_canvas(picture, frames):
+    art_canvas.update(random.randbytes(len(art_canvas.pixels)))
+    samples = []
+    for _ in range(frames):
+        started_at = time.perf_counter()
+        render_canvas(picture.canvases, picture.matrix)
+        samples.append(time.perf_counter() - started_at)
+    result = summarize(samples)
+    result["fps"] = len(samples) / sum(samples)
+    return result
+
+
+def bench_mode(picture, target, args, frames):
+    """Per-frame cost of a render mode, run flat out: holding a frame returns
+    at once, so each interval between holds is the work of one frame."""
+    samples = []
+    last = None
+
+    def hold(timeout):
+        nonlocal last
+        now = time.perf_counter()
+        if last is not None:
+            samples.append(now - last)
+        last = time.perf_counter()
+        return len(samples) >= frames
+
+    picture.thread = StoppableThread(target=target, args=args)
+    picture.thread.frame_timing.wait = hold
+    picture.thread.frame_timing.report = lambda: None
+    picture.thread.start()
+    picture.thread.join()
+    picture.thread = None
+    return summarize(samples)
+
+
+def bench_http_canvas(requests_count):
+    import totem
+
+    client = totem.create_flask_app().test_client()
+    full_frame = zlib.compress(random.randbytes(len(art_canvas.pixels)))
+    # A 64 pixel span change, as sent by the web client while drawing
+    delta = zlib.compress(b"\x00\x40\x00\x40" + random.randbytes(64))
+    results = {}
+    for name, headers_for, payload in [
+        ("full", lambda i: {"Stream-Id": "bench", "Frame-Id": str(i)}, full_frame),
+        (
+            "delta",
+            lambda i: {
+                "Stream-Id": "bench",
+                "Frame-Id": str(i),
+                "Frame-Type": "delta",
+                "Base-Frame-Id": str(i - 1),
+            },
+            delta,
+        ),
+    ]:
+        client.post(
+            "/api/canvas",
+            data=full_frame,
+            headers={"Stream-Id": "bench", "Frame-Id": "0"},
+        )
+        samples = []
+        for i in range(1, requests_count + 1):
+            started_at = time.perf_counter()
+            response = client.post(
+                "/api/canvas", data=payload, headers=headers_for(i)
+            )
+            samples.append(time.perf_counter() - started_at)
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/canvas returned {response.status_code}")
+        results[name] = summarize(samples)
+        results[name]["requests_per_second"] = len(samples) / sum(samples)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repo_root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+BENCHMARKS = [
+    "startup",
+    "gif",
+    "render_canvas",
+    "scroll_text",
+    "display_help",
+    "http",
+]
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="Headless benchmarks for the render pipeline"
+    )
+    p.add_argument(
+        "-o",
+        "--output",
+        help="Write results to this file instead of stdout",
+        type=Path,
+    )
+    p.add_argument(
+        "--only",
+        help="Run only these benchmarks",
+        nargs="+",
+        choices=BENCHMARKS,
+        default=BENCHMARKS,
+    )
+    p.add_argument(
+        "--repeat", help="Repetitions per measurement. Default: 5", type=int, default=5
+    )
+    p.add_argument(
+        "--frames",
+        help="Frames or requests per throughput benchmark. Default: 500",
+        type=int,
+        default=500,
+    )
+    args = p.parse_args(ARGV[1:])
+
+    random.seed(0)
+    # Benchmarks measure the pipeline, not the instrumentation
+    metrics.set_enabled(False)
+    results = {}
+    # Keep stdout for the JSON; the totem's own logging goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        picture = new_picture()
+        for name in args.only:
+            print(f"Running {name}...")
+            if name == "startup":
+                results[name] = bench_startup(args.repeat)
+            elif name == "gif":
+                results[name] = bench_gif_decode_upload(picture, args.repeat)
+            elif name == "render_canvas":
+                results[name] = bench_render_canvas(picture, args.frames)
+            elif name == "scroll_text":
+                results[name] = bench_mode(
+                    picture,
+                    picture.scroll_text,
+                    ("Benchmarking the totem",),
+                    args.frames,
+                )
+            elif name == "display_help":
+                results[name] = bench_mode(
+                    picture, picture.display_help, (), args.frames
+                )
+            elif name == "http":
+                results[name] = bench_http_canvas(args.frames)
+
+    output = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
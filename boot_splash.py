@@ -0,0 +1,43 @@
+import os
+
+from frame_archive import FrameArchive, write_archive
+from frame_cache import iter_frames
+
+
+def _mtime_ns(path):
+    return os.stat(path).st_mtime_ns if path is not None else 0
+
+
+def load_splash(splash_path, command_path=None):
+    """First frame of the default command as stored by refresh_splash, or None
+    if there isn't one or the default command was changed after it was saved.
+    A single raw frame, so showing it needs no decode."""
+    try:
+        if os.stat(splash_path).st_mtime_ns < _mtime_ns(command_path):
+            return None
+        with FrameArchive(splash_path) as archive:
+            return archive.frame(0)
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring boot splash {splash_path}: {e}")
+        return None
+
+
+def refresh_splash(splash_path, source_path, command_path=None):
+    """Save the first frame of source_path as the boot splash, unless the one
+    on disk is already newer than both the source and the default command."""
+    try:
+        splash_mtime = os.stat(splash_path).st_mtime_ns
+    except OSError:
+        splash_mtime = None
+    try:
+        if splash_mtime is not None and splash_mtime >= max(
+            _mtime_ns(source_path), _mtime_ns(command_path)
+        ):
+            return
+        for frame, duration in iter_frames(source_path):
+            write_archive(splash_path, [frame], [duration])
+            print(f"Saved boot splash from {source_path}")
+            break
+    except (OSError, ValueError) as e:
+        print(f"Could not save boot splash from {source_path}: {e}")
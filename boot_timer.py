@@ -0,0 +1,22 @@
+import time
+
+# Import this first so the breakdown covers the rest of the imports too
+_started_at = time.monotonic()
+_marks = []
+
+
+def mark(stage):
+    """Record that stage has finished."""
+    now = time.monotonic()
+    _marks.append((stage, now))
+    print(f"Boot: {stage} done at {(now - _started_at) * 1000:.0f} ms")
+
+
+def report():
+    """Print how long each startup stage took."""
+    print("Boot timing breakdown:")
+    previous = _started_at
+    for stage, at in _marks:
+        print(f"  {stage:<16} {(at - previous) * 1000:7.0f} ms")
+        previous = at
+    print(f"  {'total':<16} {(previous - _started_at) * 1000:7.0f} ms")
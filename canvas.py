@@ -1,12 +1,45 @@
+import struct
+import threading
 import time
+import zlib
 
 from PIL import Image
 
+import palette
+
+FULL_FRAME = 0
+DELTA_FRAME = 1
+# Delta payloads are a sequence of spans: offset u16, length u16, then that many
+# RGB332 bytes to write at offset in the row-major frame
+SPAN_HEADER = struct.Struct(">HH")
+# WebSocket messages: frame id u32, frame type u8, [base frame id u32 if delta], zlib payload
+STREAM_HEADER = struct.Struct(">IB")
+BASE_ID = struct.Struct(">I")
+
 
 def current_time():
     return time.time() * 1000
 
 
+def parse_stream_message(message):
+    """Split a WebSocket canvas message into (frame_id, frame_type, base_id, payload).
+
+    Returns None if the message is malformed."""
+    if len(message) < STREAM_HEADER.size:
+        return None
+    frame_id, frame_type = STREAM_HEADER.unpack_from(message, 0)
+    offset = STREAM_HEADER.size
+    base_id = None
+    if frame_type == DELTA_FRAME:
+        if len(message) < offset + BASE_ID.size:
+            return None
+        (base_id,) = BASE_ID.unpack_from(message, offset)
+        offset += BASE_ID.size
+    elif frame_type != FULL_FRAME:
+        return None
+    return frame_id, frame_type, base_id, message[offset:]
+
+
 class Canvas:
     def __init__(
         self,
@@ -15,34 +48,113 @@ class Canvas:
     ):
         self.width = width
         self.height = height
-        self.grid = [[0 for _ in range(width)] for _ in range(height)]
+        # Row-major RGB332 frame buffer, one byte per pixel
+        self.pixels = bytearray(width * height)
+        # Id of the frame currently held, which deltas are based on. Clients
+        # number frames from 1, so ids are (stream, number) pairs where the
+        # stream tells senders apart.
+        self.frame_id = None
         self.last_updated_at = current_time()
+        # Bumped whenever the pixels change, so renderers can wait on it
+        self.version = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
 
     def clear(self):
-        self.grid = [[0 for _ in range(self.width)] for _ in range(self.height)]
+        with self.lock:
+            self.pixels[:] = bytes(len(self.pixels))
+            self.frame_id = None
+            self._mark_changed()
+
+    def update(self, blob, frame_id=None):
+        """Replace the frame. Returns False if blob isn't a whole frame."""
+        if len(blob) != len(self.pixels):
+            return False
+        with self.lock:
+            self.frame_id = frame_id
+            if self.pixels != blob:
+                self.pixels[:] = blob
+                self._mark_changed()
+        return True
+
+    def update_compressed(self, data, frame_id=None):
+        # Cap the output at one frame so a bad payload can't balloon in memory
+        try:
+            blob = zlib.decompressobj().decompress(data, len(self.pixels) + 1)
+        except zlib.error:
+            return False
+        return self.update(blob, frame_id)
+
+    def apply_delta(self, blob, base_id, frame_id=None):
+        """Write the spans in blob over the frame in place.
+
+        Returns False without touching the frame if base_id isn't the frame we
+        hold or blob is malformed; the client should then send a full frame."""
+        spans = []
+        pos = 0
+        while pos < len(blob):
+            if pos + SPAN_HEADER.size > len(blob):
+                return False
+            offset, length = SPAN_HEADER.unpack_from(blob, pos)
+            pos += SPAN_HEADER.size
+            if offset + length > len(self.pixels) or pos + length > len(blob):
+                return False
+            spans.append((offset, blob[pos : pos + length]))
+            pos += length
+        with self.lock:
+            if base_id is None or base_id != self.frame_id:
+                return False
+            changed = False
+            for offset, data in spans:
+                if self.pixels[offset : offset + len(data)] != data:
+                    self.pixels[offset : offset + len(data)] = data
+                    changed = True
+            self.frame_id = frame_id
+            if changed:
+                self._mark_changed()
+        return True
+
+    def snapshot(self):
+        """A copy of the current frame as RGB332 bytes."""
+        with self.lock:
+            return bytes(self.pixels)
+
+    def wait_for_change(self, version, timeout=None, stopped=None):
+        """Block until the canvas version differs from version, stopped()
+        returns True (call wake() after it flips), or timeout.
+
+        Returns the current version."""
+        with self.changed:
+            self.changed.wait_for(
+                lambda: self.version != version or (stopped is not None and stopped()),
+                timeout,
+            )
+            return self.version
+
+    def wake(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def _mark_changed(self):
+        # Caller holds self.lock
         self.last_updated_at = current_time()
+        self.version += 1
+        self.changed.notify_all()
 
-    def update(self, grid):
-        if len(grid) != self.height or len(grid[0]) != self.width:
-            return
-        self.grid = grid
-        self.last_updated_at = current_time()
+    def apply_delta_compressed(self, data, base_id, frame_id=None):
+        max_length = len(self.pixels) * (SPAN_HEADER.size + 1)
+        try:
+            blob = zlib.decompressobj().decompress(data, max_length + 1)
+        except zlib.error:
+            return False
+        if len(blob) > max_length:
+            return False
+        return self.apply_delta(blob, base_id, frame_id)
 
 
 art_canvas = Canvas()
 
 
-def rgb332_to_rgb(byte: int) -> tuple[int, int, int, int]:
-    r3 = (byte >> 5) & 0x07
-    g3 = (byte >> 2) & 0x07
-    b2 = byte & 0x03
-
-    r = round((r3 / 7) * 255)
-    g = round((g3 / 7) * 255)
-    b = round((b2 / 3) * 255)
-    return (r, g, b, 255)
-
-
 def double(image):
     images = [image, image]
     doubled = Image.new("RGB", (image.size[0], image.size[1] * 2))
@@ -53,17 +165,8 @@ def double(image):
     return doubled
 
 
-last_rendered = 0
-
-
 def render_canvas(canvases, matrix):
-    global last_rendered
-    if last_rendered >= art_canvas.last_updated_at:
-        return
-    last_rendered = current_time()
-    img = Image.new("RGB", (art_canvas.width, art_canvas.height))
-    for j, row in enumerate(art_canvas.grid):
-        for i, cell in enumerate(row):
-            img.putpixel((i, j), rgb332_to_rgb(cell))
+    # A copy taken under the lock, so HTTP and WebSocket writes can't tear the frame
+    img = palette.decode_image(art_canvas.snapshot(), (art_canvas.width, art_canvas.height))
     canvases[0].SetImage(double(img))
     matrix.SwapOnVSync(canvases[0])
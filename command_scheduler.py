@@ -0,0 +1,68 @@
+import threading
+
+RESTART = object()
+
+
+class CommandScheduler:
+    """Runs command switches on a dedicated thread so BLE writes and HTTP
+    requests return immediately. Commands submitted while a switch is in
+    progress are coalesced: only the latest pending one runs."""
+
+    def __init__(self, run_command, restart, current=None):
+        self.run_command = run_command
+        self.restart = restart
+        self.current = current
+        self.running = None
+        self.pending = None
+        self.has_pending = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(
+            target=self._run, name="command-scheduler", daemon=True
+        )
+        self.thread.start()
+
+    def submit(self, value):
+        # BLE writes arrive as a list of dbus.Byte
+        value = "".join([str(x) for x in value])
+        with self.condition:
+            if self.has_pending and self.pending is not RESTART:
+                print(f"Dropping superseded command: {self.pending}")
+            self.pending = value
+            self.has_pending = True
+            self.condition.notify()
+
+    def submit_restart(self):
+        """Re-run the current command, unless another command is already queued."""
+        with self.condition:
+            if not self.has_pending:
+                self.pending = RESTART
+                self.has_pending = True
+                self.condition.notify()
+
+    def state(self):
+        with self.condition:
+            pending = self.pending if self.has_pending else None
+            return {
+                "current": self.current,
+                "switching_to": self.running,
+                "pending": None if pending is RESTART else pending,
+            }
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.has_pending)
+                value = self.pending
+                self.pending = None
+                self.has_pending = False
+                self.running = self.current if value is RESTART else value
+            try:
+                if value is RESTART:
+                    self.restart()
+                else:
+                    self.run_command(value)
+            except Exception as e:
+                print(f"Command failed: {e!r}")
+            with self.condition:
+                self.current = self.running
+                self.running = None
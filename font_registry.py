@@ -0,0 +1,83 @@
+import os
+import pickle
+import threading
+from pathlib import Path
+
+from matrix_backend import graphics
+from text_strip import BdfFont
+
+# Bump when BdfFont's attributes change so stale glyph caches are ignored
+GLYPH_CACHE_VERSION = 1
+GLYPH_CACHE_DIRNAME = ".cache"
+
+_lock = threading.Lock()
+_fonts = {}
+_bdf_fonts = {}
+
+
+def get_font(path):
+    """Shared graphics.Font for the BDF file at path, loaded on first use."""
+    path = os.path.abspath(path)
+    with _lock:
+        font = _fonts.get(path)
+        if font is None:
+            font = graphics.Font()
+            font.LoadFont(path)
+            _fonts[path] = font
+        return font
+
+
+def get_bdf_font(path):
+    """Shared BdfFont for path, parsed once per process and backed by a
+    pickled glyph cache next to the font so later boots skip the parse too."""
+    path = os.path.abspath(path)
+    with _lock:
+        font = _bdf_fonts.get(path)
+        if font is None:
+            font = _load_bdf_font(Path(path))
+            _bdf_fonts[path] = font
+        return font
+
+
+def preload(paths):
+    """Parse fonts on a background thread so the first text mode doesn't wait."""
+
+    def load_all():
+        for path in paths:
+            try:
+                get_bdf_font(path)
+            except OSError as e:
+                print(f"Could not preload font {path}: {e}")
+
+    thread = threading.Thread(target=load_all, name="font-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def _glyph_cache_path(path):
+    return (
+        path.parent
+        / GLYPH_CACHE_DIRNAME
+        / f"{path.name}.v{GLYPH_CACHE_VERSION}.pickle"
+    )
+
+
+def _load_bdf_font(path):
+    cache_path = _glyph_cache_path(path)
+    try:
+        if cache_path.stat().st_mtime >= path.stat().st_mtime:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+        pass
+
+    font = BdfFont(path)
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(font, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write glyph cache for {path}: {e}")
+    return font
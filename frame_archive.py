@@ -0,0 +1,116 @@
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from PIL import Image
+
+# .totemframes layout (little endian):
+#   header:    magic "TOTF", version u8, flags u8, width u16, height u16, frame count u32
+#   durations: frame count * u32, in milliseconds
+#   frames:    frame count * width * height * 3 bytes of contiguous RGB
+MAGIC = b"TOTF"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHHI")
+EXTENSION = ".totemframes"
+COMPILED_DIRNAME = "compiled"
+IMAGES_DIRNAME = "images"
+
+
+def archive_path(source_path):
+    """Map <root>/images/<rel> to <root>/compiled/<rel>.totemframes."""
+    parts = Path(source_path).parts
+    if IMAGES_DIRNAME not in parts:
+        return None
+    i = len(parts) - 1 - parts[::-1].index(IMAGES_DIRNAME)
+    compiled = Path(*parts[:i], COMPILED_DIRNAME, *parts[i + 1 : -1])
+    return compiled / (parts[-1] + EXTENSION)
+
+
+def write_archive(path, frames, durations):
+    width, height = frames[0].size
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, width, height, len(frames)))
+        f.write(struct.pack(f"<{len(durations)}I", *durations))
+        for frame in frames:
+            if frame.size != (width, height):
+                frame = frame.resize((width, height))
+            f.write(frame.convert("RGB").tobytes())
+    os.replace(tmp_path, path)
+
+
+class FrameArchive:
+    """Read-only, mmap-backed view of a .totemframes file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Every read below is length checked first, so a corrupt file raises
+        # ValueError like any other bad archive instead of struct.error
+        if len(self.mmap) < HEADER.size:
+            self.mmap.close()
+            raise ValueError(f"{path} is truncated")
+        magic, version, _, self.width, self.height, self.num_frames = (
+            HEADER.unpack_from(self.mmap, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            self.mmap.close()
+            raise ValueError(f"{path} is not a version {VERSION} totemframes file")
+        self.frame_size = self.width * self.height * 3
+        self.frames_offset = HEADER.size + 4 * self.num_frames
+        if len(self.mmap) < self.frames_offset + self.num_frames * self.frame_size:
+            self.mmap.close()
+            raise ValueError(f"{path} is truncated")
+        self.durations = list(
+            struct.unpack_from(f"<{self.num_frames}I", self.mmap, HEADER.size)
+        )
+
+    def frame_bytes(self, frame_index):
+        start = self.frames_offset + frame_index * self.frame_size
+        return memoryview(self.mmap)[start : start + self.frame_size]
+
+    def frame(self, frame_index):
+        # Raw RGB straight from the mapping, no GIF/PNG decode involved. RGB is
+        # not a PIL map mode, so the pixels are copied and outlive the mmap.
+        with self.frame_bytes(frame_index) as data:
+            return Image.frombuffer(
+                "RGB", (self.width, self.height), data, "raw", "RGB", 0, 1
+            )
+
+    def close(self):
+        self.mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_archive(source_path):
+    """The compiled archive for source_path, or None if there is no archive or
+    it is older than the source file."""
+    path = archive_path(source_path)
+    if path is None:
+        return None
+    try:
+        if os.stat(path).st_mtime < os.stat(source_path).st_mtime:
+            return None
+        return FrameArchive(path)
+    except (OSError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"Ignoring compiled frames for {source_path}: {e}")
+        return None
+
+
+def load_archive(source_path):
+    """Frames and durations from the compiled archive for source_path, or None."""
+    archive = open_archive(source_path)
+    if archive is None:
+        return None
+    with archive:
+        frames = [archive.frame(i) for i in range(archive.num_frames)]
+        return frames, archive.durations
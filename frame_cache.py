@@ -0,0 +1,123 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+import metrics
+from frame_archive import load_archive, open_archive
+
+DEFAULT_BUDGET_MB = 32
+
+
+def decode_frames(path):
+    """Frames and durations for path, from its compiled .totemframes archive
+    if there is one, otherwise decoded from the source file."""
+    archived = load_archive(path)
+    if archived is not None:
+        return archived
+    return decode_source_frames(path)
+
+
+def decode_source_frames(path):
+    """Decode every frame of the image/GIF at path into RGB images.
+
+    Returns (frames, durations) where durations are in milliseconds."""
+    frames = []
+    durations = []
+    with Image.open(path) as image:
+        for frame_index in range(getattr(image, "n_frames", 1)):
+            image.seek(frame_index)
+            durations.append(image.info.get("duration", 100))
+            frames.append(image.convert("RGB"))
+    return frames, durations
+
+
+def iter_frames(path):
+    """Yield (frame, duration) one frame at a time, without materializing the
+    whole animation."""
+    archive = open_archive(path)
+    if archive is not None:
+        with archive:
+            for frame_index in range(archive.num_frames):
+                yield archive.frame(frame_index), archive.durations[frame_index]
+        return
+    with Image.open(path) as image:
+        for frame_index in range(getattr(image, "n_frames", 1)):
+            image.seek(frame_index)
+            yield image.convert("RGB"), image.info.get("duration", 100)
+
+
+def count_frames(path):
+    archive = open_archive(path)
+    if archive is not None:
+        with archive:
+            return archive.num_frames
+    with Image.open(path) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def frames_size(frames):
+    # PIL stores RGB images padded to 4 bytes per pixel
+    return sum(frame.size[0] * frame.size[1] * 4 for frame in frames)
+
+
+class FrameCache:
+    """LRU cache of decoded RGB frames, keyed by path and mtime, bounded by a
+    memory budget. Entries bigger than the whole budget are never cached."""
+
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.used_bytes = 0
+        self.entries = OrderedDict()  # path -> (mtime, frames, durations, size)
+        self.lock = threading.Lock()
+
+    def set_budget_mb(self, budget_mb):
+        with self.lock:
+            self.budget_bytes = budget_mb * 1024 * 1024
+            self._evict()
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def get(self, path):
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != mtime:
+                return None
+            self.entries.move_to_end(path)
+            return entry[1], entry[2]
+
+    def put(self, path, frames, durations):
+        mtime = os.stat(path).st_mtime_ns
+        size = frames_size(frames)
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.used_bytes -= old[3]
+            if size > self.budget_bytes:
+                return
+            self.entries[path] = (mtime, frames, durations, size)
+            self.used_bytes += size
+            self._evict()
+
+    def load(self, path):
+        """Return (frames, durations) for path, decoding only on a cache miss."""
+        cached = self.get(path)
+        if cached is not None:
+            return cached
+        with metrics.timer("decode_seconds", "Frame cache misses, decoding a file"):
+            frames, durations = decode_frames(path)
+        self.put(path, frames, durations)
+        return frames, durations
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used_bytes = 0
+
+    def _evict(self):
+        while self.used_bytes > self.budget_bytes and self.entries:
+            _, (_, _, _, size) = self.entries.popitem(last=False)
+            self.used_bytes -= size
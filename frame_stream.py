@@ -0,0 +1,107 @@
+import queue
+import threading
+
+from frame_cache import iter_frames
+
+DEFAULT_RING_SIZE = 8
+
+
+class FrameStream:
+    """Plays a long animation through a fixed ring of canvases.
+
+    A background decoder thread fills free canvases with the next frames while
+    the render loop swaps in the head of the ring, so time-to-first-frame and
+    memory don't depend on how many frames the animation has. The decoder
+    loops back to the first frame once it runs off the end, forever or for
+    loops passes.
+
+    frames, if given, is (images, durations) already decoded from path, e.g.
+    from the frame cache; they are played instead of decoding path again."""
+
+    def __init__(self, path, canvases, frames=None, loops=None):
+        self.path = path
+        self.frames = frames
+        self.loops = loops
+        self.free = queue.Queue()
+        for canvas in canvases:
+            self.free.put(canvas)
+        # Keep one canvas on screen and one being decoded into out of the ring
+        self.ready = queue.Queue(maxsize=max(len(canvases) - 2, 1))
+        self._stop_event = threading.Event()
+        # Set if decoding failed, e.g. a truncated GIF or a deleted file
+        self.error = None
+        self.decoder = threading.Thread(target=self._decode, daemon=True)
+
+    def start(self):
+        self.decoder.start()
+
+    def stop(self):
+        self._stop_event.set()
+        # Wake the decoder wherever it blocks: a None for a free canvas, and
+        # room in the ready queue
+        self.free.put(None)
+        while True:
+            try:
+                self.ready.get_nowait()
+            except queue.Empty:
+                break
+        self.decoder.join()
+
+    def next_frame(self, timeout=0.1):
+        """(canvas, duration) of the next decoded frame, or None on timeout."""
+        try:
+            return self.ready.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def dead(self):
+        """True once the decoder has given up and every decoded frame has been
+        taken, so next_frame() will never return another."""
+        return not self.decoder.is_alive() and self.ready.empty()
+
+    def release(self, canvas):
+        """Hand back a canvas that is no longer on screen."""
+        self.free.put(canvas)
+
+    def _decode(self):
+        try:
+            self._decode_frames()
+        except Exception as error:
+            print(f"Could not decode {self.path}: {error!r}")
+            self.error = error
+
+    def _decode_frames(self):
+        passes = 0
+        while not self._stop_event.is_set():
+            decoded_any = False
+            if self.frames is not None:
+                source = zip(*self.frames)
+            else:
+                source = iter_frames(self.path)
+            for frame, duration in source:
+                decoded_any = True
+                canvas = self._take_free()
+                if canvas is None:
+                    return
+                canvas.SetImage(frame)
+                if not self._put_ready((canvas, duration)):
+                    return
+            if not decoded_any:
+                raise ValueError("no frames")
+            passes += 1
+            if self.loops is not None and passes >= self.loops:
+                return
+
+    def _take_free(self):
+        canvas = self.free.get()
+        if self._stop_event.is_set():
+            return None
+        return canvas
+
+    def _put_ready(self, item):
+        # stop() sets the event before draining, so a put that misses the
+        # check below still finds room
+        if self._stop_event.is_set():
+            return False
+        self.ready.put(item)
+        return not self._stop_event.is_set()
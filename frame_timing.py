@@ -0,0 +1,113 @@
+import time
+
+import metrics
+
+# Further behind than this and the schedule restarts from now instead of
+# dropping its way back, e.g. after a long upload between GIFs
+MAX_LAG_SECONDS = 0.5
+
+
+def _sleep(timeout):
+    time.sleep(timeout)
+    return False
+
+
+class FrameScheduler:
+    """Paces a render loop on absolute deadlines from the monotonic clock.
+
+    Each frame is held until the previous deadline plus its duration, rather
+    than for its duration from whenever it was shown, so time spent drawing,
+    uploading and swapping doesn't add up as drift. A loop that falls behind
+    can ask should_drop() and skip frames whose time has already passed."""
+
+    def __init__(self, wait=_sleep, name="render"):
+        # wait(timeout) sleeps and returns True if the loop should stop
+        self.wait = wait
+        self.name = name
+        self.deadline = None
+        self.last_shown_at = None
+        # Duration asked for the frame on screen, counted once it's replaced
+        self.showing_seconds = 0.0
+        self.shown = 0
+        self.dropped = 0
+        self.resyncs = 0
+        # Only frames that have finished count towards stats(), so the frame
+        # still on screen doesn't inflate the achieved rate
+        self.completed = 0
+        self.completed_seconds = 0.0
+        self.target_seconds = 0.0
+
+    def reset(self):
+        """Start the schedule again from the next frame shown."""
+        self.deadline = None
+        self.last_shown_at = None
+
+    def start(self):
+        """Start the schedule from now."""
+        self.deadline = time.monotonic()
+
+    def hold(self, duration):
+        """Keep the frame just shown for duration seconds from the previous
+        deadline. Returns True if wait() reported a stop."""
+        now = time.monotonic()
+        if self.last_shown_at is not None:
+            interval = now - self.last_shown_at
+            metrics.observe(
+                "frame_seconds",
+                interval,
+                "Time between frames, by render mode",
+                mode=self.name,
+            )
+            self.completed += 1
+            self.completed_seconds += interval
+            self.target_seconds += self.showing_seconds
+        self.last_shown_at = now
+        if self.deadline is None:
+            self.deadline = now
+        elif now - self.deadline > MAX_LAG_SECONDS:
+            self.resyncs += 1
+            metrics.increment(
+                "frame_resyncs", help="Schedules restarted after a stall", mode=self.name
+            )
+            self.deadline = now
+        self.deadline += duration
+        self.shown += 1
+        self.showing_seconds = duration
+        return self.wait(max(self.deadline - time.monotonic(), 0))
+
+    def should_drop(self, duration):
+        """True if a frame lasting duration would already be over if shown now."""
+        return self.deadline is not None and time.monotonic() - self.deadline >= duration
+
+    def drop(self, duration):
+        """Skip a frame lasting duration, keeping the schedule."""
+        self.deadline += duration
+        self.dropped += 1
+        metrics.increment(
+            "frames_dropped", help="Frames skipped to catch up", mode=self.name
+        )
+        self.target_seconds += duration
+
+    def stats(self):
+        frames = self.completed + self.dropped
+        return {
+            "name": self.name,
+            "frames": self.shown,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+            "achieved_fps": (
+                self.completed / self.completed_seconds if self.completed_seconds else 0.0
+            ),
+            "target_fps": frames / self.target_seconds if self.target_seconds else 0.0,
+        }
+
+    def report(self):
+        # Nothing to report for loops that reset before every frame (canvas)
+        if not self.completed:
+            return
+        stats = self.stats()
+        print(
+            f"{self.name}: {stats['achieved_fps']:.1f} fps achieved, "
+            f"{stats['target_fps']:.1f} fps target, {self.dropped} frames dropped, "
+            f"{self.resyncs} resyncs"
+        )
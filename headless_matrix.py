@@ -0,0 +1,195 @@
+"""Matrix backends that need neither the panel nor the browser emulator.
+
+NullMatrix discards everything it is given. RecorderMatrix draws like the
+real library and keeps every frame that reaches the panel, in an in-memory
+ring and optionally appended to a raw RGB file. Both mirror the parts of the
+rgbmatrix API the totem uses, including a graphics namespace."""
+
+import collections
+import os
+import threading
+import time
+import types
+
+from PIL import Image, ImageDraw
+
+import palette
+from text_strip import BdfFont, TextStrip
+
+DEFAULT_RECORD_FRAMES = 300
+
+
+class RGBMatrixOptions:
+    def __init__(self):
+        self.rows = 32
+        self.cols = 32
+        self.chain_length = 1
+        self.parallel = 1
+        self.brightness = 100
+
+
+class FrameCanvas:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.brightness = 100
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        pass
+
+    def SetPixel(self, x, y, r, g, b):
+        pass
+
+    def Clear(self):
+        pass
+
+    def Fill(self, r, g, b):
+        pass
+
+
+class RecordingCanvas(FrameCanvas):
+    """A canvas whose pixels are kept in an RGB image."""
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.image = Image.new("RGB", (width, height))
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        self.image.paste(image.convert("RGB"), (offset_x, offset_y))
+
+    def SetPixel(self, x, y, r, g, b):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.image.putpixel((x, y), (r, g, b))
+
+    def Clear(self):
+        self.Fill(0, 0, 0)
+
+    def Fill(self, r, g, b):
+        self.image.paste((r, g, b), (0, 0, self.width, self.height))
+
+
+class NullMatrix(FrameCanvas):
+    canvas_class = FrameCanvas
+
+    def __init__(self, options=None):
+        options = options or RGBMatrixOptions()
+        # The V-Mapper stacks chained panels vertically
+        super().__init__(options.cols, options.rows * options.chain_length)
+        self.brightness = options.brightness
+        self.front = self.canvas_class(self.width, self.height)
+
+    def CreateFrameCanvas(self):
+        return self.canvas_class(self.width, self.height)
+
+    def SwapOnVSync(self, canvas, framerate_fraction=1):
+        previous, self.front = self.front, canvas
+        self.shown()
+        return previous
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        self.front.SetImage(image, offset_x, offset_y, unsafe)
+        self.shown()
+
+    def Clear(self):
+        self.front.Clear()
+        self.shown()
+
+    def Fill(self, r, g, b):
+        self.front.Fill(r, g, b)
+        self.shown()
+
+    def shown(self):
+        """Called whenever what's on the panel changes."""
+
+
+class RecorderMatrix(NullMatrix):
+    """Records (monotonic time, RGB bytes) for every frame shown.
+
+    TOTEM_RECORD_FRAMES sets how many recent frames the ring keeps, and
+    TOTEM_RECORD_PATH, if set, gets every frame appended as raw RGB,
+    width * height * 3 bytes each."""
+
+    canvas_class = RecordingCanvas
+
+    def __init__(self, options=None):
+        super().__init__(options)
+        self.frames = collections.deque(
+            maxlen=int(os.environ.get("TOTEM_RECORD_FRAMES", DEFAULT_RECORD_FRAMES))
+        )
+        self.lock = threading.Lock()
+        path = os.environ.get("TOTEM_RECORD_PATH")
+        self.file = open(path, "ab") if path else None
+
+    def shown(self):
+        data = self.front.image.tobytes()
+        with self.lock:
+            self.frames.append((time.monotonic(), data))
+            if self.file is not None:
+                self.file.write(data)
+
+    def recorded_frames(self):
+        """The frames in the ring as (time, image) pairs, oldest first."""
+        with self.lock:
+            frames = list(self.frames)
+        return [
+            (at, Image.frombytes("RGB", (self.width, self.height), data))
+            for at, data in frames
+        ]
+
+    def snapshot(self):
+        """What's on the panel now, as RGB332 bytes."""
+        return palette.encode_image(self.front.image)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Color:
+    def __init__(self, red=0, green=0, blue=0):
+        self.red = red
+        self.green = green
+        self.blue = blue
+
+
+class Font:
+    def LoadFont(self, path):
+        self.bdf = BdfFont(path)
+        self.height = self.bdf.height
+        self.baseline = self.bdf.baseline
+
+    def CharacterWidth(self, codepoint):
+        glyph = self.bdf.glyph(codepoint)
+        return glyph[0] if glyph is not None else 0
+
+
+def _rgb(color):
+    return (color.red, color.green, color.blue)
+
+
+def DrawText(canvas, font, x, y, color, text):
+    if isinstance(canvas, RecordingCanvas):
+        return TextStrip(font.bdf, text).draw(canvas.image, x, y, color)
+    return font.bdf.text_width(text)
+
+
+def DrawLine(canvas, x0, y0, x1, y1, color):
+    if isinstance(canvas, RecordingCanvas):
+        ImageDraw.Draw(canvas.image).line((x0, y0, x1, y1), fill=_rgb(color))
+
+
+def DrawCircle(canvas, x, y, radius, color):
+    if isinstance(canvas, RecordingCanvas):
+        ImageDraw.Draw(canvas.image).ellipse(
+            (x - radius, y - radius, x + radius, y + radius), outline=_rgb(color)
+        )
+
+
+graphics = types.SimpleNamespace(
+    Color=Color,
+    Font=Font,
+    DrawText=DrawText,
+    DrawLine=DrawLine,
+    DrawCircle=DrawCircle,
+)
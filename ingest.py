@@ -0,0 +1,147 @@
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+DEFAULT_WORKERS = 2
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadTooLarge(Exception):
+    pass
+
+
+def resize_image(data, size):
+    with Image.open(BytesIO(data)) as image:
+        # reducing_gap shrinks big sources cheaply before the LANCZOS pass
+        return image.convert("RGB").resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+
+def resize_gif(data, size):
+    frames = []
+    durations = []
+    with Image.open(BytesIO(data)) as image:
+        loop = image.info.get("loop", 0)
+        for frame_index in range(getattr(image, "n_frames", 1)):
+            image.seek(frame_index)
+            durations.append(image.info.get("duration", 100))
+            frames.append(
+                image.convert("RGB").resize(size, Image.LANCZOS, reducing_gap=2.0)
+            )
+    return frames, durations, loop
+
+
+def _failed(future):
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+
+class Ingester:
+    """Downloads remote images/GIFs off the render path.
+
+    Jobs run on a small worker pool sharing one pooled HTTP session, with
+    timeouts and a size limit. Resized results are cached by the hash of the
+    downloaded bytes, so the same content is only resized once whatever URL
+    or name it comes under."""
+
+    def __init__(
+        self,
+        cache_dir,
+        size,
+        workers=DEFAULT_WORKERS,
+        timeout=DEFAULT_TIMEOUT,
+        max_bytes=DEFAULT_MAX_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.size = size
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self.lock = threading.Lock()
+        self.jobs = {}  # (url, output_path) -> Future
+        self._session = None
+
+    def session(self):
+        with self.lock:
+            if self._session is None:
+                import requests  # Only needed for downloads, keep it off the boot path
+
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.workers)
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def job(self, url, output_path):
+        """The Future for an earlier submit of url to output_path, or None.
+
+        A failed job is returned once and then forgotten, so the next attempt
+        downloads again instead of failing for the life of the process."""
+        key = (url, str(output_path))
+        with self.lock:
+            future = self.jobs.get(key)
+            if future is not None and _failed(future):
+                del self.jobs[key]
+            return future
+
+    def submit(self, url, output_path, kind):
+        """Download url, resize it and save it to output_path in the background.
+        kind is "gif" or "png". Returns a Future resolving to output_path;
+        submitting the same job again returns the same Future, unless it failed."""
+        key = (url, str(output_path))
+        with self.lock:
+            future = self.jobs.get(key)
+            if future is None or _failed(future):
+                future = self.pool.submit(self._ingest, url, Path(output_path), kind)
+                self.jobs[key] = future
+            return future
+
+    def _fetch(self, url):
+        with self.session().get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length is not None and int(length) > self.max_bytes:
+                raise DownloadTooLarge(f"{url} is {length} bytes")
+            data = bytearray()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                data += chunk
+                if len(data) > self.max_bytes:
+                    raise DownloadTooLarge(f"{url} is over {self.max_bytes} bytes")
+            return bytes(data)
+
+    def _ingest(self, url, output_path, kind):
+        data = self._fetch(url)
+        digest = hashlib.sha256(data).hexdigest()
+        cached = self.cache_dir / f"{digest}-{self.size[0]}x{self.size[1]}.{kind}"
+        if cached.exists():
+            print(f"Already ingested {url}, reusing {cached.name}")
+        else:
+            if kind == "gif":
+                frames, durations, loop = resize_gif(data, self.size)
+                save = dict(
+                    save_all=True,
+                    append_images=frames[1:],
+                    optimize=True,
+                    duration=durations,
+                    loop=loop,
+                )
+            else:
+                frames = [resize_image(data, self.size)]
+                save = {}
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = cached.with_name(cached.name + ".tmp")
+            frames[0].save(tmp_path, format=kind.upper(), **save)
+            os.replace(tmp_path, cached)
+        # Dot-prefixed so the asset index never sees a half-copied file
+        tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+        shutil.copyfile(cached, tmp_path)
+        os.replace(tmp_path, output_path)
+        return output_path
@@ -3,19 +3,18 @@ import time
 import sys
 import os
 
+from boot_splash import load_splash
 from dev import IS_DEV
+from matrix_backend import RGBMatrix, RGBMatrixOptions
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__) + "/.."))
 
-if IS_DEV:
-    print("rgbmatrix not found, Importing RGBMatrixEmulator")
-    from RGBMatrixEmulator import RGBMatrix, RGBMatrixOptions
-else:
-    from rgbmatrix import RGBMatrix, RGBMatrixOptions  # type: ignore
-
 
 class Matrix(object):
     def __init__(self, *args, **kwargs):
+        # Shown as soon as the RGBMatrix exists, see boot_splash
+        self.boot_splash_path = None
+        self.boot_splash_command_path = None
         self.parser = argparse.ArgumentParser()
 
         self.parser.add_argument(
@@ -181,6 +180,10 @@ class Matrix(object):
         options.drop_privileges = False
 
         self.matrix = RGBMatrix(options=options)
+        if self.boot_splash_path is not None:
+            splash = load_splash(self.boot_splash_path, self.boot_splash_command_path)
+            if splash is not None:
+                self.matrix.SetImage(splash)
         self.canvas = self.matrix.CreateFrameCanvas()
 
         self.canvases = [self.matrix.CreateFrameCanvas() for i in range(10)]
@@ -0,0 +1,30 @@
+"""The one place that picks the matrix library.
+
+TOTEM_MATRIX_BACKEND selects it:
+  hardware  rgbmatrix, driving the panel (default on the Pi)
+  emulator  RGBMatrixEmulator's browser adapter (default on macOS)
+  null      headless_matrix.NullMatrix, discards frames
+  recorder  headless_matrix.RecorderMatrix, keeps the frames it is shown
+Everything else imports RGBMatrix, RGBMatrixOptions and graphics from here."""
+
+import os
+
+from dev import IS_DEV
+
+BACKEND = os.environ.get("TOTEM_MATRIX_BACKEND") or (
+    "emulator" if IS_DEV else "hardware"
+)
+
+if BACKEND == "hardware":
+    from rgbmatrix import RGBMatrix, RGBMatrixOptions, graphics  # type: ignore
+elif BACKEND == "emulator":
+    print("rgbmatrix not found, Importing RGBMatrixEmulator")
+    from RGBMatrixEmulator import RGBMatrix, RGBMatrixOptions, graphics
+elif BACKEND == "null":
+    from headless_matrix import NullMatrix as RGBMatrix, RGBMatrixOptions, graphics
+elif BACKEND == "recorder":
+    from headless_matrix import RecorderMatrix as RGBMatrix, RGBMatrixOptions, graphics
+else:
+    raise ValueError(
+        f"Unknown TOTEM_MATRIX_BACKEND {BACKEND!r}, expected hardware, emulator, null or recorder"
+    )
@@ -0,0 +1,248 @@
+import math
+import os
+import resource
+import threading
+import time
+
+# Set TOTEM_METRICS=0 to turn instrumentation off. Disabled, every call below
+# returns after a single flag check.
+ENABLED = os.environ.get("TOTEM_METRICS", "1") != "0"
+PREFIX = "totem_"
+# Seconds; covers 1 ms frames up to multi-second decodes
+DEFAULT_BUCKETS = (
+    0.001, 0.002, 0.005, 0.01, 0.0167, 0.025, 0.0333, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, math.inf,
+)
+# BLE attribute values are capped at 512 bytes
+BLE_SUMMARY_MAX_BYTES = 512
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> Histogram
+_counters = {}  # (name, labels) -> value
+_help = {}
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = enabled
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def observe(name, value, help=None, **labels):
+    """Add value (in seconds) to the histogram name{labels}."""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+            if help is not None:
+                _help.setdefault(name, help)
+        histogram.observe(value)
+
+
+def increment(name, amount=1, help=None, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+        if help is not None:
+            _help.setdefault(name, help)
+
+
+class _Timer:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started_at
+        observe(self.name, elapsed, self.help, **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+def timer(name, help=None, **labels):
+    """Context manager observing how long its body takes."""
+    if not ENABLED:
+        return _null_timer
+    return _Timer(name, help, labels)
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current RSS, in KB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def thread_cpu_seconds():
+    """CPU time used by each live thread, by thread name."""
+    ticks_per_second = os.sysconf("SC_CLK_TCK")
+    cpu = {}
+    for thread in threading.enumerate():
+        try:
+            with open(f"/proc/self/task/{thread.native_id}/stat", "r") as f:
+                # Fields after the parenthesized command name; utime and stime
+                # are the 14th and 15th fields of the whole line
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError, TypeError):
+            continue
+        cpu[thread.name] = (int(fields[11]) + int(fields[12])) / ticks_per_second
+    return cpu
+
+
+def snapshot():
+    """Everything collected so far, plus process gauges, as plain data."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    with _lock:
+        histograms = [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                # Bounds as strings, like Prometheus' "le", so +Inf survives JSON
+                "buckets": [
+                    [_format_bound(bound), count]
+                    for bound, count in zip(histogram.buckets, histogram.counts)
+                ],
+            }
+            for (name, labels), histogram in sorted(_histograms.items())
+        ]
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+    return {
+        "enabled": ENABLED,
+        "histograms": histograms,
+        "counters": counters,
+        "process": {
+            "rss_bytes": rss_bytes(),
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            "thread_cpu_seconds": thread_cpu_seconds(),
+        },
+    }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == math.inf else repr(bound)
+
+
+def to_prometheus():
+    """snapshot() in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+    typed = set()
+
+    def declare(name, kind, suffix=""):
+        if name not in typed:
+            typed.add(name)
+            if name in _help:
+                lines.append(f"# HELP {PREFIX}{name}{suffix} {_help[name]}")
+            lines.append(f"# TYPE {PREFIX}{name}{suffix} {kind}")
+
+    for histogram in data["histograms"]:
+        name = histogram["name"]
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, count in histogram["buckets"]:
+            cumulative += count
+            lines.append(
+                f"{PREFIX}{name}_bucket{_format_labels(histogram['labels'], le=bound)} {cumulative}"
+            )
+        labels = _format_labels(histogram["labels"])
+        lines.append(f"{PREFIX}{name}_sum{labels} {histogram['sum']}")
+        lines.append(f"{PREFIX}{name}_count{labels} {histogram['count']}")
+    for counter in data["counters"]:
+        declare(counter["name"], "counter", "_total")
+        lines.append(
+            f"{PREFIX}{counter['name']}_total{_format_labels(counter['labels'])} {counter['value']}"
+        )
+    process = data["process"]
+    lines.append(f"# TYPE {PREFIX}process_resident_memory_bytes gauge")
+    lines.append(f"{PREFIX}process_resident_memory_bytes {process['rss_bytes']}")
+    lines.append(f"# TYPE {PREFIX}process_cpu_seconds_total counter")
+    lines.append(f"{PREFIX}process_cpu_seconds_total {process['cpu_seconds']}")
+    lines.append(f"# TYPE {PREFIX}thread_cpu_seconds_total counter")
+    for thread_name, seconds in sorted(process["thread_cpu_seconds"].items()):
+        lines.append(
+            f"{PREFIX}thread_cpu_seconds_total{_format_labels({'thread': thread_name})} {seconds}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    """A short human readable digest that fits in a BLE read."""
+    data = snapshot()
+    process = data["process"]
+    parts = [
+        f"rss {process['rss_bytes'] / 1024 / 1024:.1f}MB cpu {process['cpu_seconds']:.1f}s"
+    ]
+    dropped = {
+        c["labels"].get("mode"): c["value"]
+        for c in data["counters"]
+        if c["name"] == "frames_dropped"
+    }
+    for histogram in data["histograms"]:
+        if histogram["name"] != "frame_seconds" or not histogram["count"]:
+            continue
+        mode = histogram["labels"].get("mode")
+        mean_ms = histogram["sum"] / histogram["count"] * 1000
+        parts.append(
+            f"{mode} {mean_ms:.1f}ms x{histogram['count']} drop {dropped.get(mode, 0)}"
+        )
+    if not data["enabled"]:
+        parts.append("metrics off")
+    text = " | ".join(parts)
+    return text.encode()[:BLE_SUMMARY_MAX_BYTES].decode(errors="ignore")
@@ -0,0 +1,89 @@
+"""RGB332, the one byte per pixel format the web canvas sends: 3 bits of red,
+3 of green and 2 of blue.
+
+Everything is table driven. Decoding looks each byte up in a 256 entry
+palette; encoding quantizes each channel to its nearest level through a 256
+entry table per channel. The bulk functions work on whole byte buffers with
+bytes.translate, so a frame costs a handful of C-level passes, not a Python
+loop per pixel."""
+
+from PIL import Image
+
+RED_LEVELS = 8
+GREEN_LEVELS = 8
+BLUE_LEVELS = 4
+
+
+def _level_values(levels):
+    return [round(level / (levels - 1) * 255) for level in range(levels)]
+
+
+def _nearest_level(levels):
+    return [round(value * (levels - 1) / 255) for value in range(256)]
+
+
+_RED = _level_values(RED_LEVELS)
+_GREEN = _level_values(GREEN_LEVELS)
+_BLUE = _level_values(BLUE_LEVELS)
+
+# RGB332 byte -> (r, g, b)
+RGB332_TO_RGB = tuple(
+    (_RED[(byte >> 5) & 0x07], _GREEN[(byte >> 2) & 0x07], _BLUE[byte & 0x03])
+    for byte in range(256)
+)
+
+# Flat [r, g, b, r, g, b, ...] palette for every RGB332 byte, for Image.putpalette
+RGB332_PALETTE = [c for rgb in RGB332_TO_RGB for c in rgb]
+
+# 8 bit channel value -> its bits of the RGB332 byte, for bytes.translate
+_ENCODE_RED = bytes(level << 5 for level in _nearest_level(RED_LEVELS))
+_ENCODE_GREEN = bytes(level << 2 for level in _nearest_level(GREEN_LEVELS))
+_ENCODE_BLUE = bytes(_nearest_level(BLUE_LEVELS))
+
+# RGB332 byte -> one 8 bit channel, for bytes.translate
+_DECODE_RED = bytes(rgb[0] for rgb in RGB332_TO_RGB)
+_DECODE_GREEN = bytes(rgb[1] for rgb in RGB332_TO_RGB)
+_DECODE_BLUE = bytes(rgb[2] for rgb in RGB332_TO_RGB)
+
+
+def rgb332_to_rgb(byte: int) -> tuple[int, int, int]:
+    return RGB332_TO_RGB[byte]
+
+
+def rgb_to_rgb332(r: int, g: int, b: int) -> int:
+    return _ENCODE_RED[r] | _ENCODE_GREEN[g] | _ENCODE_BLUE[b]
+
+
+def encode(rgb) -> bytes:
+    """Packed RGB bytes (r, g, b, r, g, b, ...) to RGB332, one byte per pixel."""
+    rgb = bytes(rgb)
+    length = len(rgb) // 3
+    # The three channels occupy disjoint bits, so OR-ing them as big integers
+    # packs every pixel at once
+    packed = (
+        int.from_bytes(rgb[0::3].translate(_ENCODE_RED), "big")
+        | int.from_bytes(rgb[1::3].translate(_ENCODE_GREEN), "big")
+        | int.from_bytes(rgb[2::3].translate(_ENCODE_BLUE), "big")
+    )
+    return packed.to_bytes(length, "big")
+
+
+def decode(rgb332) -> bytes:
+    """RGB332 bytes to packed RGB bytes."""
+    rgb332 = bytes(rgb332)
+    rgb = bytearray(len(rgb332) * 3)
+    rgb[0::3] = rgb332.translate(_DECODE_RED)
+    rgb[1::3] = rgb332.translate(_DECODE_GREEN)
+    rgb[2::3] = rgb332.translate(_DECODE_BLUE)
+    return bytes(rgb)
+
+
+def encode_image(image) -> bytes:
+    return encode(image.convert("RGB").tobytes())
+
+
+def decode_image(rgb332, size) -> Image.Image:
+    """An RGB image of size from RGB332 bytes."""
+    image = Image.frombuffer("P", size, rgb332, "raw", "P", 0, 1)
+    image.putpalette(RGB332_PALETTE)
+    return image.convert("RGB")
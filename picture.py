@@ -1,25 +1,35 @@
 #!/usr/bin/env python
-from canvas import render_canvas
+from asset_index import AssetIndex
+from boot_splash import refresh_splash
+from canvas import art_canvas, render_canvas
+from command_scheduler import CommandScheduler
 from dev import IS_DEV
+from frame_cache import DEFAULT_BUDGET_MB, FrameCache, count_frames
+from frame_stream import DEFAULT_RING_SIZE, FrameStream
+from frame_timing import FrameScheduler
 from matrix import Matrix
+import metrics
 import time
 from pokerscope import Pokerscope
+from ingest import Ingester
+from font_registry import get_bdf_font, preload as preload_fonts
+from text_strip import TextStrip, clear_frame
 from pathlib import Path
-import requests
-from PIL import Image
-from io import BytesIO
+from PIL import Image, ImageDraw
 import os
 import threading
 import random
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
-if IS_DEV:
-    print("rgbmatrix not found, Importing RGBMatrixEmulator")
-    from RGBMatrixEmulator import graphics
-else:
-    from rgbmatrix import graphics  # type: ignore
+from matrix_backend import graphics
 
 START_INSTRUCTIONS_STR = "Welcome! Use nRF Connect, connect to `totem`, and edit the UTF-8 value of the characteristic that starts with 000002. Type 'help' for available commands, or just type any text you want!"
 TOTEM_LED_SIZE = (64, 64)
+# Fonts used by the text modes, parsed in the background at startup
+TEXT_FONTS = ["9x18.bdf", "6x13.bdf", "4x6.bdf"]
+BRIGHTNESS_RAMP_SECONDS = 0.3
+BRIGHTNESS_RAMP_STEP = 0.03
 WHITE = graphics.Color(255, 255, 255)
 RAINBOW_COLORS = [
     graphics.Color(255, 0, 0),
@@ -55,71 +65,59 @@ RGB_COLORS = [
 # ]
 
 
-def download_image(url, output_path, resize_to=TOTEM_LED_SIZE):
-    try:
-        # Download the image from the URL
-        response = requests.get(url)
-        if response.status_code == 200:
-            # Open the image using PIL
-            image = Image.open(BytesIO(response.content))
-            # Resize the image
-            resized_image = image.resize(resize_to)
-            # Save the resized image
-            resized_image.save(output_path)
-        else:
-            print("Failed to download image. Status code:", response.status_code)
-    except Exception as e:
-        print("An error occurred:", e)
-
-
-def download_gif(url, output_path, resize_to=TOTEM_LED_SIZE):
-    try:
-        # Download the image from the URL
-        response = requests.get(url)
-        if response.status_code == 200:
-            # Open the image using PIL
-            image = Image.open(BytesIO(response.content))
-            frames = []
-            for frame in range(image.n_frames):
-                image.seek(frame)
-                resized_frame = image.resize(resize_to, Image.LANCZOS)
-                frames.append(resized_frame.copy())
-
-            frames[0].save(
-                output_path,
-                save_all=True,
-                append_images=frames[1:],
-                optimize=True,
-                duration=image.info["duration"],
-                loop=image.info["loop"],
-            )
-        else:
-            print("Failed to download image. Status code:", response.status_code)
-    except Exception as e:
-        print("An error occurred:", e)
-
-
 class StoppableThread(threading.Thread):
     """Thread class with a stop() method. The thread itself has to check
-    regularly for the stopped() condition."""
+    regularly for the stopped() condition, and should sleep with wait() so a
+    stop request cuts the sleep short."""
 
     def __init__(self, *args, **kwargs):
         super(StoppableThread, self).__init__(*args, **kwargs)
         self._stop_event = threading.Event()
+        self._stop_callbacks = []
+        # Shared by whatever animation the thread runs; prints its fps on stop
+        target = kwargs.get("target")
+        self.frame_timing = FrameScheduler(
+            self.wait, getattr(target, "__name__", self.name)
+        )
+        self._stop_callbacks.append(self.frame_timing.report)
 
     def stop(self):
         self._stop_event.set()
+        for callback in self._stop_callbacks:
+            callback()
 
     def stopped(self):
         return self._stop_event.is_set()
 
+    def wait(self, timeout):
+        """Sleep for up to timeout seconds. Returns True if stop() was called."""
+        return self._stop_event.wait(timeout)
+
+    def on_stop(self, callback):
+        """Call callback from stop(), to wake the thread from other blocking waits."""
+        self._stop_callbacks.append(callback)
+        if self.stopped():
+            callback()
+
+    def wait_result(self, future, poll=0.01):
+        """future.result(), or None if stop() is called first."""
+        while not self.stopped():
+            try:
+                return future.result(timeout=poll)
+            except FutureTimeoutError:
+                pass
+        return None
+
 
 default_command = "shrek"
+default_command_path = None
 if IS_DEV:
     DIR = os.path.dirname(os.path.abspath(__file__))
+    boot_splash_path = Path(DIR) / ".default_command.totemframes"
 else:  # Linux
     DIR = "/home/totem/totem"
     default_command_path = Path("/home/totem/.default_command")
+    boot_splash_path = Path("/home/totem/.default_command.totemframes")
     default_command_path.parent.mkdir(parents=True, exist_ok=True)
     if not default_command_path.exists():
         with open(default_command_path, "w") as f:
@@ -135,6 +133,10 @@ class Picture(Matrix):
         self.name = random.choice(defaults)
         self.thread = None
         self.color = "party"
+        self.boot_splash_path = boot_splash_path
+        self.boot_splash_command_path = default_command_path
+        # BLE/HTTP callers go through here instead of calling run_command directly
+        self.commands = CommandScheduler(self.run_command, self.restart, self.name)
 
         self.parser.add_argument(
             "--img", help="URL of image to download, resize, and render", type=str
@@ -148,6 +150,33 @@ class Picture(Matrix):
         self.parser.add_argument(
             "--name", help="Name for downloaded content", type=str, default=None
         )
+        self.parser.add_argument(
+            "--frame-cache-mb",
+            help=f"Memory budget for decoded GIF frames. Default: {DEFAULT_BUDGET_MB}",
+            type=int,
+            default=DEFAULT_BUDGET_MB,
+        )
+        self.parser.add_argument(
+            "--stream-min-frames",
+            help="Stream GIFs with at least this many frames instead of decoding them all up front. Default: 64",
+            type=int,
+            default=64,
+        )
+        self.parser.add_argument(
+            "--canvas-max-fps",
+            help="Cap on how often canvas mode re-renders. Default: 60",
+            type=int,
+            default=60,
+        )
+        self.frame_cache = FrameCache()
+        self.prefetch_canvases = []
+        # Redraws what's on screen from already decoded frames, see set_brightness
+        self.reupload = None
+        self.upload_lock = threading.Lock()
+        self.ramp_generation = 0
+        self.ingester = Ingester(f"{DIR}/.ingest_cache", TOTEM_LED_SIZE)
+        # Name being downloaded while the loading animation shows
+        self.placeholder_for = None
 
         self.colors = {
             "-r": graphics.Color(255, 0, 0),
@@ -157,15 +186,90 @@ class Picture(Matrix):
             "-p": "party",
             "-party": "party",
         }
-        paths_unsorted = {}
-        self.all_subdirs = []
-        for path, subdirs, files in os.walk(f"{DIR}/images"):
-            self.all_subdirs.extend(subdirs)
-            for name in files:
-                simple_name = name.split(".")[0].lower()
-                paths_unsorted[simple_name] = os.path.join(path, name)
         # List all the pre-downloaded images/gifs
-        self.paths = {k: paths_unsorted[k] for k in sorted(paths_unsorted.keys())}
+        self.assets = AssetIndex(f"{DIR}/images", f"{DIR}/.asset_index.json")
+
+    @property
+    def paths(self):
+        return self.assets.paths
+
+    @property
+    def all_subdirs(self):
+        return self.assets.all_subdirs
+
+    def process(self, *args, **kwargs):
+        result = super(Picture, self).process(*args, **kwargs)
+        self.frame_cache.set_budget_mb(self.args.frame_cache_mb)
+        preload_fonts([f"{DIR}/fonts/{name}" for name in TEXT_FONTS])
+        return result
+
+    def upload_frames(self, images, canvases=None):
+        """SetImage each frame onto its own FrameCanvas, growing the canvases
+        list (self.canvases by default) as needed."""
+        if canvases is None:
+            canvases = self.canvases
+        with metrics.timer("upload_seconds", "Uploading decoded frames to canvases"):
+            for frame_index, image in enumerate(images):
+                if frame_index >= len(canvases):
+                    canvases.append(self.matrix.CreateFrameCanvas())
+                canvases[frame_index].SetImage(image)
+        return canvases[: len(images)]
+
+    def set_reupload(self, reupload):
+        """Remember how to redraw the current mode from its decoded frames.
+        Only needed by modes that upload once and then just swap canvases
+        (GIFs, stills) or that only draw on demand (canvas); modes that draw
+        every frame pick brightness up anyway."""
+        with self.upload_lock:
+            self.reupload = reupload
+
+    def set_brightness(self, brightness):
+        """Apply brightness to the running mode without restarting it."""
+        if brightness == self.matrix.brightness:
+            return
+        self.matrix.brightness = brightness
+        for canvas in [self.canvas, *self.canvases, *self.prefetch_canvases]:
+            if hasattr(canvas, "brightness"):
+                canvas.brightness = brightness
+        # Brightness is applied when pixels are written, so frames that are
+        # already uploaded have to be written again
+        with self.upload_lock:
+            if self.reupload is not None:
+                self.reupload()
+
+    def ramp_brightness(self, brightness, duration=BRIGHTNESS_RAMP_SECONDS):
+        """Fade to brightness over duration seconds on a background thread. A
+        new ramp takes over from one still in progress."""
+        self.ramp_generation += 1
+        generation = self.ramp_generation
+        start = self.matrix.brightness
+        steps = max(int(duration / BRIGHTNESS_RAMP_STEP), 1)
+
+        def ramp():
+            for step in range(1, steps + 1):
+                if generation != self.ramp_generation:
+                    return
+                self.set_brightness(round(start + (brightness - start) * step / steps))
+                if step < steps:
+                    time.sleep(BRIGHTNESS_RAMP_STEP)
+
+        threading.Thread(target=ramp, name="brightness-ramp", daemon=True).start()
+
+    def should_stream(self, name, file):
+        # Cached or not, a long GIF is played through the ring so the canvas
+        # lists never grow to its frame count
+        frames = (self.assets.describe(name) or {}).get("frames")
+        if frames is None:
+            # The index couldn't read it; let the decoder have a go
+            frames = count_frames(file)
+        return frames >= self.args.stream_min_frames
+
+    def ring_canvases(self, canvases):
+        """The first DEFAULT_RING_SIZE canvases of a canvas list, creating any
+        that are missing."""
+        while len(canvases) < DEFAULT_RING_SIZE:
+            canvases.append(self.matrix.CreateFrameCanvas())
+        return canvases[:DEFAULT_RING_SIZE]
 
     def double(self, image):
         images = [image, image]
@@ -176,12 +280,22 @@ class Picture(Matrix):
             y_offset += im.size[1]
         return doubled
 
-    def run_command(self, value):
+    def stop_thread(self):
         if self.thread is not None:
             self.thread.stop()
             self.thread.join()
-        self.name = "".join([str(x) for x in value])
-        print(f"Changing totem to: {self.name}")
+
+    def run_command(self, value):
+        with metrics.timer(
+            "command_switch_seconds", "Stopping one mode and starting the next"
+        ):
+            self.stop_thread()
+            self.name = "".join([str(x) for x in value])
+            print(f"Changing totem to: {self.name}")
+            self.run()
+
+    def restart(self):
+        self.stop_thread()
         self.run()
 
     def run(self):
@@ -189,8 +303,12 @@ class Picture(Matrix):
             self.name = self.args.name
         lowercase_name = self.name.lower().strip()
         print(f"lowercase version of input: {lowercase_name}")
+        self.set_reupload(None)
+        self.placeholder_for = None
 
-        all_file_names = list(self.paths.keys())
+        # Picks up files added or changed since boot; only those are reopened
+        self.assets.refresh()
+        all_file_names = self.assets.names
 
         print("All subdirs that you can choose to cycle through")
         print(self.all_subdirs)
@@ -228,7 +346,7 @@ class Picture(Matrix):
                 f"Cycling through everything from {lowercase_name}! Only cycling through images for now"
             )
             gif = False
-            for f in os.listdir(f"{DIR}/images/{lowercase_name}"):
+            for f in self.assets.files_in(lowercase_name):
                 if f.split(".")[-1].lower() == "gif":
                     gif = True
                     break
@@ -269,23 +387,25 @@ class Picture(Matrix):
         # If image/gif can be downloaded
         if lowercase_name not in all_file_names:
             if self.args.img or self.args.gif:
-                print("Image/gif does not exist, downloading from provided url...")
-                if self.args.img:
-                    download_image(
-                        self.args.img,
-                        f"{DIR}/images/{lowercase_name}.png",
-                        resize_to=TOTEM_LED_SIZE,
+                kind, url = ("gif", self.args.gif) if self.args.gif else ("png", self.args.img)
+                output_path = f"{DIR}/images/{lowercase_name}.{kind}"
+                job = self.ingester.job(url, output_path)
+                if job is None:
+                    print("Image/gif does not exist, downloading from provided url...")
+                    job = self.ingester.submit(url, output_path, kind)
+                    job.add_done_callback(
+                        lambda job: self.ingested(lowercase_name, job)
                     )
-                    self.paths[lowercase_name] = f"{DIR}/images/{lowercase_name}.png"
-                    all_file_names.append(lowercase_name)
-                if self.args.gif:
-                    download_gif(
-                        self.args.gif,
-                        f"{DIR}/images/{lowercase_name}.gif",
-                        resize_to=TOTEM_LED_SIZE,
-                    )
-                    self.paths[lowercase_name] = f"{DIR}/images/{lowercase_name}.gif"
-                    all_file_names.append(lowercase_name)
+                if not job.done():
+                    # ingested() swaps the real thing in once it's ready
+                    self.placeholder_for = lowercase_name
+                    self.thread = StoppableThread(target=self.loading)
+                    self.thread.start()
+                    return
+                if job.exception() is not None:
+                    print(f"Displaying text {self.name}")
+                else:
+                    self.assets.refresh()
             else:
                 print(f"Displaying text {self.name}")
 
@@ -296,6 +416,14 @@ class Picture(Matrix):
         except KeyError:
             file = None
 
+        if (
+            file is not None
+            and file.split(".")[-1] in ("gif", "png")
+            and lowercase_name == default_command.lower().strip()
+        ):
+            # Keep the splash Matrix.process shows at boot in sync with the default
+            refresh_splash(self.boot_splash_path, file, self.boot_splash_command_path)
+
         # Display text if no image/gif to display
         if file is None:
             print("In text display thread")
@@ -311,23 +439,22 @@ class Picture(Matrix):
             print("Starting text thread")
             self.thread.start()
         elif file.split(".")[-1] == "png":
-            image = Image.open(f"{file}")
-            self.matrix.SetImage(image.convert("RGB"))
+            images, _ = self.frame_cache.load(file)
+            self.matrix.SetImage(images[0])
+            self.set_reupload(lambda: self.matrix.SetImage(images[0]))
+        elif file.split(".")[-1] == "gif" and self.should_stream(lowercase_name, file):
+            # Frames already in the cache are streamed without decoding again
+            stream = FrameStream(
+                file, self.ring_canvases(self.canvases), self.frame_cache.get(file)
+            )
+            self.thread = StoppableThread(target=self.gif_stream, args=(stream,))
+            print("Starting streaming GIF thread")
+            self.thread.start()
         elif file.split(".")[-1] == "gif":
-            gif = Image.open(f"{file}")
-            num_frames = gif.n_frames
-            durations = []
-            frames = []
-            for frame_index in range(0, num_frames):
-                gif.seek(frame_index)
-                duration = gif.info["duration"]
-                durations.append(duration)
-                frame = gif.copy()
-                if frame_index >= len(self.canvases):
-                    self.canvases.append(self.matrix.CreateFrameCanvas())
-                self.canvases[frame_index].SetImage(frame.convert("RGB"))
-                frames.append(self.canvases[frame_index])
-            gif.close()
+            images, durations = self.frame_cache.load(file)
+            frames = self.upload_frames(images)
+            self.set_reupload(lambda: self.upload_frames(images))
+            num_frames = len(frames)
             self.thread = StoppableThread(
                 target=self.gif, args=(frames, num_frames, durations)
             )
@@ -341,85 +468,172 @@ class Picture(Matrix):
             print("Starting text thread")
             self.thread.start()
 
+    def ingested(self, name, job):
+        if job.exception() is not None:
+            print(f"Could not download {name}: {job.exception()!r}")
+        # Replace the loading animation, unless another command took over
+        if self.placeholder_for == name:
+            self.commands.submit_restart()
+
+    def loading(self):
+        frame = self.new_text_frame()
+        draw = ImageDraw.Draw(frame)
+        box = (20, 20, 43, 43)
+        angle = 0
+        timing = self.thread.frame_timing
+        timing.reset()
+        while True:
+            clear_frame(frame)
+            draw.arc(box, angle, angle + 270, fill=(255, 255, 255), width=3)
+            self.canvas.SetImage(frame)
+            angle = (angle + 12) % 360
+            if timing.hold(0.03):
+                break
+            self.canvas = self.matrix.SwapOnVSync(self.canvas)
+            if self.thread.stopped():
+                break
+
+    def show_frame(self, canvas, duration):
+        """Swap canvas in and hold it for duration milliseconds.
+
+        Holding goes through the thread's FrameScheduler, which waits on the
+        stop event until the frame's deadline, so returns True as soon as the
+        thread is asked to stop."""
+        self.matrix.SwapOnVSync(canvas)
+        return self.thread.frame_timing.hold(duration / 1000)
+
+    def next_frame_index(self, cur_frame, durations):
+        """Index of the GIF frame after cur_frame, skipping frames whose time
+        already passed while we were behind."""
+        timing = self.thread.frame_timing
+        num_frames = len(durations)
+        next_frame = (cur_frame + 1) % num_frames
+        for _ in range(num_frames - 1):
+            if not timing.should_drop(durations[next_frame] / 1000):
+                break
+            timing.drop(durations[next_frame] / 1000)
+            next_frame = (next_frame + 1) % num_frames
+        return next_frame
+
     def gif(self, frames, num_frames, durations):
+        self.thread.frame_timing.reset()
         cur_frame = 0
         while True:
-            if IS_DEV:
-                self.matrix.SwapOnVSync(frames[cur_frame])
-                time.sleep(durations[cur_frame] / 1000)
-            else:
-                self.matrix.SwapOnVSync(
-                    frames[cur_frame],
-                    framerate_fraction=max(durations[cur_frame] // 10, 1),
-                )
-            if cur_frame == num_frames - 1:
-                cur_frame = 0
-            else:
-                cur_frame += 1
+            if self.show_frame(frames[cur_frame], durations[cur_frame]):
+                break
+            cur_frame = self.next_frame_index(cur_frame, durations)
             if self.thread.stopped():
                 break
 
+    def gif_stream(self, stream):
+        timing = self.thread.frame_timing
+        timing.reset()
+        stream.start()
+        on_screen = None
+        try:
+            while True:
+                next_frame = stream.next_frame(timeout=0.01)
+                if next_frame is not None:
+                    canvas, duration = next_frame
+                    if timing.should_drop(duration / 1000):
+                        timing.drop(duration / 1000)
+                        stream.release(canvas)
+                        continue
+                    stopped = self.show_frame(canvas, duration)
+                    if on_screen is not None:
+                        stream.release(on_screen)
+                    on_screen = canvas
+                    if stopped:
+                        break
+                elif stream.dead():
+                    break
+                if self.thread.stopped():
+                    break
+        finally:
+            stream.stop()
+        if stream.error is not None and not self.thread.stopped():
+            print(f"Displaying text {self.name}")
+            self.scroll_text(self.name)
+
     def gif_n(self, frames, num_frames, iters, framerate, durations):
+        self.thread.frame_timing.reset()
         cur_frame = 0
         i = 0
         while i < iters:
-            if IS_DEV:
-                self.matrix.SwapOnVSync(frames[cur_frame])
-                time.sleep(durations[cur_frame] / 1000)
-            else:
-                self.matrix.SwapOnVSync(
-                    frames[cur_frame],
-                    framerate_fraction=max(durations[cur_frame] // 10, 1),
-                )
-            if cur_frame == num_frames - 1:
-                cur_frame = 0
+            if self.show_frame(frames[cur_frame], durations[cur_frame]):
+                break
+            next_frame = self.next_frame_index(cur_frame, durations)
+            if next_frame <= cur_frame:
                 i += 1
-            else:
-                cur_frame += 1
+            cur_frame = next_frame
             if self.thread.stopped():
                 break
 
+    def new_text_frame(self):
+        return Image.new("RGB", (self.canvas.width, self.canvas.height))
+
     def scroll_text(self, string, wait_time=0.015, textsize="normal", once=False):
-        font = graphics.Font()
         if textsize == "normal":
-            font.LoadFont(f"{DIR}/fonts/9x18.bdf")
+            font = get_bdf_font(f"{DIR}/fonts/9x18.bdf")
         elif textsize == "small":
-            font.LoadFont(f"{DIR}/fonts/4x6.bdf")
+            font = get_bdf_font(f"{DIR}/fonts/4x6.bdf")
         else:
             raise ValueError(
                 "Should never have a text size that is not normal or small"
             )
+        # Rasterize once; each frame only blits the visible window
+        strip = TextStrip(font, string)
+        frame = self.new_text_frame()
         color = self.color
         pos = self.canvas.width
+        timing = self.thread.frame_timing
+        timing.reset()
         while True:
             if self.color == "party":
                 color = RAINBOW_COLORS[(pos // 2) % 20]
-            self.canvas.Clear()
-            length = graphics.DrawText(self.canvas, font, pos, 32, color, string)
+            clear_frame(frame)
+            length = strip.draw(frame, pos, 32, color)
+            self.canvas.SetImage(frame)
             pos -= 2
             if pos + length < 0:
                 pos = self.canvas.width
                 if once:
                     break
-            time.sleep(wait_time)
+            if timing.hold(wait_time):
+                break
             self.canvas = self.matrix.SwapOnVSync(self.canvas)
             if self.thread.stopped():
                 break
 
     def cycle_dir_imgs(self, dirname, pause_time=2):
         full_dirname = f"{DIR}/images/{dirname}"
-        imgs_to_cycle = os.listdir(full_dirname)
+        imgs_to_cycle = self.assets.files_in(dirname)
         random.shuffle(imgs_to_cycle)  # For fun
         img_idx = 0
-        while True:
-            img_name = imgs_to_cycle[img_idx]
-            image = Image.open(os.path.join(full_dirname, img_name))
-            self.matrix.SetImage(image.convert("RGB"))
-
-            time.sleep(pause_time)
-            img_idx = (img_idx + 1) % len(imgs_to_cycle)
-            if self.thread.stopped():
-                break
+        # Decode the next image on a worker while the current one is shown
+        prefetcher = ThreadPoolExecutor(max_workers=1)
+        try:
+            next_image = prefetcher.submit(
+                self.frame_cache.load, os.path.join(full_dirname, imgs_to_cycle[0])
+            )
+            while True:
+                loaded = self.thread.wait_result(next_image)
+                if loaded is None:
+                    break
+                image = loaded[0][0]
+                self.matrix.SetImage(image)
+                self.set_reupload(lambda image=image: self.matrix.SetImage(image))
+
+                img_idx = (img_idx + 1) % len(imgs_to_cycle)
+                next_image = prefetcher.submit(
+                    self.frame_cache.load,
+                    os.path.join(full_dirname, imgs_to_cycle[img_idx]),
+                )
+                if self.thread.wait(pause_time):
+                    break
+        finally:
+            # Don't hold up a command switch on a decode nobody will see
+            prefetcher.shutdown(wait=False, cancel_futures=True)
 
     def cycle_dir_gifs(self, dirname):
         if dirname == "aot":
@@ -441,29 +655,59 @@ class Picture(Matrix):
             iters = 2
             framerate = 10
         full_dirname = f"{DIR}/images/{dirname}"
-        gifs_to_cycle = os.listdir(full_dirname)
+        gifs_to_cycle = self.assets.files_in(dirname)
         random.shuffle(gifs_to_cycle)
         img_idx = 0
         print(gifs_to_cycle)
-        while True:
-            gif = Image.open(f"{full_dirname}/{gifs_to_cycle[img_idx]}")
-            print(img_idx, gifs_to_cycle[img_idx])
-            num_frames = gif.n_frames
-            frames = []
-            durations = []
-            for frame_index in range(0, num_frames):
-                gif.seek(frame_index)
-                durations.append(gif.info["duration"])
-                frame = gif.copy()
-                if frame_index >= len(self.canvases):
-                    self.canvases.append(self.matrix.CreateFrameCanvas())
-                self.canvases[frame_index].SetImage(frame.convert("RGB"))
-                frames.append(self.canvases[frame_index])
-            gif.close()
-            self.gif_n(frames, num_frames, iters, framerate, durations)
-            img_idx = (img_idx + 1) % len(gifs_to_cycle)
-            if self.thread.stopped():
-                break
+        # The next GIF is decoded on a worker while the current one plays. The
+        # worker never touches canvases, so it can be abandoned on a stop; its
+        # frames are uploaded here, alternating between two canvas sets so the
+        # frame still on screen at the transition isn't overwritten.
+        canvas_sets = [self.canvases, self.prefetch_canvases]
+        prefetcher = ThreadPoolExecutor(max_workers=1)
+        try:
+            next_gif = prefetcher.submit(
+                self.frame_cache.load, f"{full_dirname}/{gifs_to_cycle[0]}"
+            )
+            while True:
+                print(img_idx, gifs_to_cycle[img_idx])
+                loaded = self.thread.wait_result(next_gif)
+                if loaded is None:
+                    break
+                images, durations = loaded
+                path = f"{full_dirname}/{gifs_to_cycle[img_idx]}"
+                stream = None
+                if len(images) >= self.args.stream_min_frames:
+                    # Long GIFs go through a ring instead of a canvas each
+                    stream = FrameStream(
+                        path,
+                        self.ring_canvases(canvas_sets[0]),
+                        (images, durations),
+                        loops=iters,
+                    )
+                    self.set_reupload(None)
+                else:
+                    frames = self.upload_frames(images, canvas_sets[0])
+                    self.set_reupload(
+                        lambda images=images, canvases=canvas_sets[0]: self.upload_frames(
+                            images, canvases
+                        )
+                    )
+                    num_frames = len(frames)
+
+                img_idx = (img_idx + 1) % len(gifs_to_cycle)
+                canvas_sets.reverse()
+                next_gif = prefetcher.submit(
+                    self.frame_cache.load, f"{full_dirname}/{gifs_to_cycle[img_idx]}"
+                )
+                if stream is not None:
+                    self.gif_stream(stream)
+                else:
+                    self.gif_n(frames, num_frames, iters, framerate, durations)
+                if self.thread.stopped():
+                    break
+        finally:
+            prefetcher.shutdown(wait=False, cancel_futures=True)
 
     def single(self, name="tim", text="is single"):
         try:
@@ -473,21 +717,30 @@ class Picture(Matrix):
             return
 
         while True:
-            image = Image.open(file)
-            self.matrix.SetImage(image.convert("RGB"))
-            time.sleep(5)
+            images, _ = self.frame_cache.load(file)
+            self.matrix.SetImage(images[0])
+            self.set_reupload(lambda: self.matrix.SetImage(images[0]))
+            if self.thread.wait(5):
+                break
 
+            self.set_reupload(None)
             self.scroll_text(text, once=True)
 
             if self.thread.stopped():
                 break
 
     def display_affirmations(self, name="You"):
-        font = graphics.Font()
-        font.LoadFont(f"{DIR}/fonts/9x18.bdf")
-        # font.LoadFont(f'{DIR}/fonts/4x6.bdf')
-        smallfont = graphics.Font()
-        smallfont.LoadFont(f"{DIR}/fonts/6x13.bdf")
+        font = get_bdf_font(f"{DIR}/fonts/9x18.bdf")
+        # font = get_bdf_font(f'{DIR}/fonts/4x6.bdf')
+        smallfont = get_bdf_font(f"{DIR}/fonts/6x13.bdf")
+        strips = {}
+
+        def draw_text(font, x, y, color, text):
+            if (font, text) not in strips:
+                strips[(font, text)] = TextStrip(font, text)
+            return strips[(font, text)].draw(frame, x, y, color)
+
+        frame = self.new_text_frame()
         color = self.color
         counter = 0
         wait_counter = 0
@@ -511,21 +764,24 @@ class Picture(Matrix):
             else:
                 return 32
 
+        timing = self.thread.frame_timing
+        timing.reset()
         while True:
             if self.color == "party":
                 color = RAINBOW_COLORS[(counter // 2) % 20]
-            self.canvas.Clear()
+            clear_frame(frame)
             aff_word = words_to_cycle[word_counter]
             x_pos = counter - len(aff_word) * 9
             counter += 1
 
             if name == "You":
-                graphics.DrawText(self.canvas, font, 19, 20, color, "You")
-                graphics.DrawText(self.canvas, font, 19, 32, color, "are")
+                draw_text(font, 19, 20, color, "You")
+                draw_text(font, 19, 32, color, "are")
             else:
-                graphics.DrawText(self.canvas, font, 19, 32, color, "is")
-                graphics.DrawText(self.canvas, smallfont, 8, 20, color, name)
-            length1 = graphics.DrawText(self.canvas, font, x_pos, 44, color, aff_word)
+                draw_text(font, 19, 32, color, "is")
+                draw_text(smallfont, 8, 20, color, name)
+            length1 = draw_text(font, x_pos, 44, color, aff_word)
+            self.canvas.SetImage(frame)
 
             # Pause at the halfway point
             if (
@@ -541,15 +797,15 @@ class Picture(Matrix):
                 counter = 0
                 wait_counter = 0
                 word_counter = (word_counter + 1) % len(words_to_cycle)
-            time.sleep(0.05)
+            if timing.hold(0.05):
+                break
             self.canvas = self.matrix.SwapOnVSync(self.canvas)
             if self.thread.stopped():
                 break
 
     def display_help(self):
         print("Inside self.display_help")
-        font = graphics.Font()
-        font.LoadFont(f"{DIR}/fonts/9x18.bdf")
+        font = get_bdf_font(f"{DIR}/fonts/9x18.bdf")
         color = self.color
         x_positions = [self.canvas.width for _ in range(3)]
         special_commands_str = " | ".join(
@@ -579,37 +835,36 @@ class Picture(Matrix):
 
         pngs_str = "pngs available: " + " | ".join(pngs_available)
         gifs_str = "gifs available: " + " | ".join(gifs_available)
+        strips = [
+            TextStrip(font, special_commands_str),
+            TextStrip(font, pngs_str),
+            TextStrip(font, gifs_str),
+        ]
+        frame = self.new_text_frame()
         color_counter = 0
+        timing = self.thread.frame_timing
+        timing.reset()
         while True:
             if self.color == "party":
                 color_counter += 1
                 colors = [RAINBOW_COLORS[(color_counter // 2) % 20] for _ in range(3)]
             else:
                 colors = RGB_COLORS
-            self.canvas.Clear()
+            clear_frame(frame)
             lengths = [
-                graphics.DrawText(
-                    self.canvas,
-                    font,
-                    x_positions[0],
-                    14,
-                    colors[0],
-                    special_commands_str,
-                ),
-                graphics.DrawText(
-                    self.canvas, font, x_positions[1], 32, colors[1], pngs_str
-                ),
-                graphics.DrawText(
-                    self.canvas, font, x_positions[2], 50, colors[2], gifs_str
-                ),
+                strips[0].draw(frame, x_positions[0], 14, colors[0]),
+                strips[1].draw(frame, x_positions[1], 32, colors[1]),
+                strips[2].draw(frame, x_positions[2], 50, colors[2]),
             ]
+            self.canvas.SetImage(frame)
 
             for i in range(len(x_positions)):
                 x_positions[i] -= 1
                 if x_positions[i] + lengths[i] < 0:
                     x_positions[i] = self.canvas.width
 
-            time.sleep(0.015)
+            if timing.hold(0.015):
+                break
             self.canvas = self.matrix.SwapOnVSync(self.canvas)
             if self.thread.stopped():
                 break
@@ -617,21 +872,51 @@ class Picture(Matrix):
     def pokerscope(self):
         print("Inside self.pokerscope")
         pokerscope = Pokerscope(f"{DIR}/fonts", self.canvas)
+        timing = self.thread.frame_timing
+        timing.reset()
         while True:
             self.canvas.Clear()
             pokerscope.tick(self.canvas)
-            time.sleep(0.015)
+            if timing.hold(0.015):
+                break
             self.canvas = self.matrix.SwapOnVSync(self.canvas)
             if self.thread.stopped():
                 break
 
     def canvas_(self):
         print("Inside self.canvas_")
+        min_interval = 1 / self.args.canvas_max_fps
+        rendered_version = None
+        timing = self.thread.frame_timing
+        redraw = threading.Event()
+
+        def request_redraw():
+            redraw.set()
+            art_canvas.wake()
+
+        # Nothing is rendered between client frames, so a brightness change
+        # has to ask for a render of the frame we already have
+        self.set_reupload(request_redraw)
+        self.thread.on_stop(art_canvas.wake)
         while True:
-            render_canvas(self.canvases, self.matrix)
-            time.sleep(0.015)
+            # Sleep until a client sends a new frame, a redraw is requested or
+            # we're asked to stop
+            version = art_canvas.wait_for_change(
+                rendered_version,
+                stopped=lambda: self.thread.stopped() or redraw.is_set(),
+            )
             if self.thread.stopped():
                 break
+            if version != rendered_version or redraw.is_set():
+                redraw.clear()
+                # Frames arrive when clients send them, so each render starts
+                # a new schedule and only the fps cap is held. Resetting also
+                # keeps the idle time between client frames out of frame_seconds.
+                timing.reset()
+                render_canvas(self.canvases, self.matrix)
+                rendered_version = version
+                if timing.hold(min_interval):
+                    break
 
 
 # Main function
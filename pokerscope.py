@@ -1,12 +1,8 @@
 import random
 import enum
 from dev import IS_DEV
-
-if IS_DEV:
-    print("rgbmatrix not found, Importing RGBMatrixEmulator")
-    from RGBMatrixEmulator import graphics
-else:
-    from rgbmatrix import graphics  # type: ignore
+from font_registry import get_font
+from matrix_backend import graphics
 
 
 WHITE = graphics.Color(255, 255, 255)
@@ -120,18 +116,13 @@ class PokerscopeQuiz:
 class PokerscopeRenderer:
     def __init__(self, canvas, font_dir):
         self.canvas = canvas
-        self.rank_font = graphics.Font()
-        self.rank_font.LoadFont(f"{font_dir}/8x13B.bdf")
-        self.suit_font = graphics.Font()
-        self.suit_font.LoadFont(f"{font_dir}/10x20.bdf")
+        self.rank_font = get_font(f"{font_dir}/8x13B.bdf")
+        self.suit_font = get_font(f"{font_dir}/10x20.bdf")
         self.text_fonts = {
-            "sm": graphics.Font(),
-            "md": graphics.Font(),
-            "lg": graphics.Font(),
+            "sm": get_font(f"{font_dir}/6x13B.bdf"),
+            "md": get_font(f"{font_dir}/7x13B.bdf"),
+            "lg": get_font(f"{font_dir}/8x13B.bdf"),
         }
-        self.text_fonts["sm"].LoadFont(f"{font_dir}/6x13B.bdf")
-        self.text_fonts["md"].LoadFont(f"{font_dir}/7x13B.bdf")
-        self.text_fonts["lg"].LoadFont(f"{font_dir}/8x13B.bdf")
 
     def set_canvas(self, canvas):
         self.canvas = canvas
@@ -0,0 +1,104 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.01
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    # ";" separates frames in the collapsed format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of every thread from a background thread and
+    counts them in the collapsed-stack format flamegraph.pl and speedscope
+    read: one "thread;outermost;...;innermost count" line per distinct stack.
+
+    Nothing runs until start(); while running each sample costs one
+    sys._current_frames() walk."""
+
+    def __init__(self, interval=DEFAULT_INTERVAL, output_dir=DEFAULT_OUTPUT_DIR):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self._stop_event = threading.Event()
+
+    def running(self):
+        return self.thread is not None
+
+    def start(self, interval=None):
+        """Start sampling. Returns False if already running."""
+        with self.lock:
+            if self.thread is not None:
+                return False
+            if interval is not None:
+                self.interval = interval
+            self.stacks = collections.Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self._stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self.thread.start()
+        print(f"Profiling every {self.interval * 1000:.0f} ms")
+        return True
+
+    def stop(self):
+        """Stop sampling and write the profile. Returns its path, or None if
+        the profiler wasn't running."""
+        with self.lock:
+            thread = self.thread
+            if thread is None:
+                return None
+            self._stop_event.set()
+            thread.join()
+            self.thread = None
+        path = self.dump()
+        print(f"Wrote {self.samples} profile samples to {path}")
+        return path
+
+    def dump(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        path = os.path.join(self.output_dir, f"profile-{stamp}.folded")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, path)
+        return path
+
+    def status(self):
+        return {
+            "running": self.running(),
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+        }
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)).replace(";", ":"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+# Shared by the HTTP routes and the BLE command characteristic
+profiler = SamplingProfiler()
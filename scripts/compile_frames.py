@@ -0,0 +1,79 @@
+import argparse
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+repo_root = Path(__file__).parent.parent
+images_dir = repo_root / "images"
+sys.path.append(str(repo_root))
+
+from frame_archive import archive_path, write_archive
+from frame_cache import decode_source_frames
+
+SUPPORTED_EXTENSIONS = [".gif", ".jpg", ".jpeg", ".png"]
+
+
+def double(frame):
+    doubled = Image.new("RGB", (frame.size[0], frame.size[1] * 2))
+    doubled.paste(frame, (0, 0))
+    doubled.paste(frame, (0, frame.size[1]))
+    return doubled
+
+
+def compile_file(p: Path, force=False, doubled=False):
+    if p.suffix.lower() not in SUPPORTED_EXTENSIONS:
+        return
+    out_path = archive_path(p.resolve())
+    if out_path is None:
+        print(f"Skipping {p} - not under {images_dir}")
+        return
+    if (
+        not force
+        and out_path.exists()
+        and out_path.stat().st_mtime >= p.stat().st_mtime
+    ):
+        return
+    frames, durations = decode_source_frames(str(p))
+    if doubled:
+        frames = [double(frame) for frame in frames]
+    write_archive(out_path, frames, durations)
+    print(f"Compiled {p} -> {out_path} ({len(frames)} frames)")
+
+
+def walk_path(path: Path, force=False, doubled=False):
+    if path.is_file():
+        compile_file(path, force, doubled)
+    elif path.is_dir():
+        for child in sorted(path.rglob("*.*")):
+            compile_file(child, force, doubled)
+    else:
+        print(f"Warning: {str(path)} not found")
+
+
+def main():
+    p = argparse.ArgumentParser(
+        description="compile images and gifs under images/ into raw .totemframes archives"
+    )
+    p.add_argument(
+        "paths",
+        nargs="*",
+        help="Files or directories to compile. Default: images/",
+        type=Path,
+        default=[images_dir],
+    )
+    p.add_argument(
+        "--force", action="store_true", help="Recompile even if up to date"
+    )
+    p.add_argument(
+        "--double",
+        action="store_true",
+        help="Store frames stacked twice (64x128) for the full chained panel",
+    )
+    args = p.parse_args()
+    for path in args.paths:
+        walk_path(path, args.force, args.double)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
 import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from PIL import Image, ImageSequence, ImageOps
 from pathlib import Path
@@ -8,6 +13,8 @@ SUPPORTED_EXTENSIONS = [".gif", ".jpg", ".jpeg", ".png"]
 TOTEM_LED_SIZE = (64, 64)
 repo_root = Path(__file__).parent.parent
 images_dir = repo_root / "images"
+# Content hash of every file as we last left it, so unchanged files are skipped
+manifest_path = repo_root / ".downsize_manifest.json"
 
 
 def thumbnails(frames):
@@ -24,6 +31,7 @@ def downsize_gif(in_path: str, out_path: str, size=(64, 64)):
             return
         frames = []
         durations = []
+        black_bg = Image.new("RGBA", size, (0, 0, 0, 255))
 
         for frame in ImageSequence.Iterator(gif):
             # 1) record the frame duration
@@ -33,7 +41,6 @@ def downsize_gif(in_path: str, out_path: str, size=(64, 64)):
             rgba = frame.convert("RGBA").resize(size, Image.LANCZOS)
 
             # 3) composite over a black background
-            black_bg = Image.new("RGBA", size, (0, 0, 0, 255))
             composited = Image.alpha_composite(black_bg, rgba)
 
             # 4) convert to a palette image (GIF) if you like, or just to RGB
@@ -74,14 +81,53 @@ def downsize_file(p: Path):
 
 def walk_path(path: Path):
     if path.is_file():
-        downsize_file(path)
+        yield path
     elif path.is_dir():
-        for child in path.rglob("*.*"):
-            downsize_file(child)
+        yield from sorted(path.rglob("*.*"))
     else:
         print(f"Warning: {str(path)} not found")
 
 
+def file_hash(p: Path):
+    return hashlib.sha256(p.read_bytes()).hexdigest()
+
+
+def manifest_key(p: Path):
+    p = p.resolve()
+    try:
+        return str(p.relative_to(repo_root.resolve()))
+    except ValueError:
+        return str(p)
+
+
+def load_manifest():
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest):
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def process_file(p: Path):
+    """Downsize one file in a worker process. Returns (path, seconds, size
+    before, size after, hash of the result, error)."""
+    started_at = time.perf_counter()
+    before = p.stat().st_size
+    try:
+        downsize_file(p)
+    except Exception as e:
+        return p, time.perf_counter() - started_at, before, before, None, repr(e)
+    after = p.stat().st_size
+    return p, time.perf_counter() - started_at, before, after, file_hash(p), None
+
+
 def main():
     p = argparse.ArgumentParser(description="downsize images and gifs to 64x64")
     p.add_argument(
@@ -90,9 +136,59 @@ def main():
         help="One or more files or directories to downsize",
         type=Path,
     )
+    p.add_argument(
+        "-j",
+        "--jobs",
+        help="Worker processes. Default: number of CPUs",
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+    p.add_argument(
+        "--force",
+        help="Process files even if they are unchanged since the last run",
+        action="store_true",
+    )
     args = p.parse_args()
+
+    # --force only skips the unchanged check; entries for other paths are kept
+    manifest = load_manifest()
+    todo = []
+    unchanged = 0
     for path in args.paths:
-        walk_path(path)
+        for child in walk_path(path):
+            if child.suffix.lower() not in SUPPORTED_EXTENSIONS:
+                print(f"Skipping {child} - not a supported extension")
+            elif not args.force and manifest.get(manifest_key(child)) == file_hash(child):
+                unchanged += 1
+            else:
+                todo.append(child)
+    print(f"{len(todo)} files to process, {unchanged} unchanged since the last run")
+
+    started_at = time.perf_counter()
+    total_before = total_after = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        futures = [pool.submit(process_file, child) for child in todo]
+        for future in as_completed(futures):
+            child, seconds, before, after, digest, error = future.result()
+            if error is not None:
+                failed += 1
+                print(f"Failed {child}: {error}")
+                continue
+            total_before += before
+            total_after += after
+            manifest[manifest_key(child)] = digest
+            saved = (1 - after / before) * 100 if before else 0
+            print(
+                f"{child}: {seconds * 1000:.0f} ms, {before / 1024:.1f} KB -> {after / 1024:.1f} KB ({saved:.0f}% smaller)"
+            )
+    save_manifest(manifest)
+
+    print(
+        f"Processed {len(todo) - failed} files in {time.perf_counter() - started_at:.1f} s "
+        f"with {args.jobs} jobs, {total_before / 1024 / 1024:.1f} MB -> {total_after / 1024 / 1024:.1f} MB"
+        + (f", {failed} failed" if failed else "")
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+from PIL import Image
+
+REPLACEMENT_CODEPOINT = 0xFFFD
+
+
+class BdfFont:
+    """Glyph bitmaps parsed from a BDF font, laid out the way rgbmatrix's
+    graphics.DrawText draws them: each glyph is device-width wide and rows are
+    placed relative to the baseline by the BBX y offset."""
+
+    def __init__(self, path):
+        self.glyphs = {}  # codepoint -> (device_width, top, rows of column bitmasks)
+        self.height = 0
+        self.baseline = 0
+        self._glyph_images = {}
+        self._parse(path)
+
+    def __getstate__(self):
+        # Glyph images are cheap to rebuild; keep pickled glyph caches small
+        state = self.__dict__.copy()
+        state["_glyph_images"] = {}
+        return state
+
+    def _parse(self, path):
+        codepoint = None
+        device_width = 0
+        bbx = None
+        rows = None
+        with open(path, "r", encoding="latin-1") as f:
+            for line in f:
+                if rows is not None:
+                    if line.startswith("ENDCHAR"):
+                        self._add_glyph(codepoint, device_width, bbx, rows)
+                        rows = None
+                    else:
+                        rows.append(int(line, 16))
+                    continue
+                fields = line.split()
+                if not fields:
+                    continue
+                keyword = fields[0]
+                if keyword == "FONTBOUNDINGBOX":
+                    self.height = int(fields[2])
+                    self.baseline = int(fields[4]) + self.height
+                elif keyword == "ENCODING":
+                    codepoint = int(fields[1])
+                elif keyword == "DWIDTH":
+                    device_width = int(fields[1])
+                elif keyword == "BBX":
+                    bbx = tuple(int(x) for x in fields[1:5])
+                elif keyword == "BITMAP":
+                    rows = []
+
+    def _add_glyph(self, codepoint, device_width, bbx, hex_rows):
+        if codepoint is None or codepoint < 0 or bbx is None:
+            return
+        width, height, x_offset, y_offset = bbx
+        hex_bits = 8 * ((width + 7) // 8)
+        rows = []
+        for value in hex_rows[:height]:
+            mask = 0
+            for i in range(hex_bits):
+                column = x_offset + i
+                if value >> (hex_bits - 1 - i) & 1 and 0 <= column < device_width:
+                    mask |= 1 << column
+            rows.append(mask)
+        # Top row relative to the baseline, as in DrawText: y - height - y_offset
+        self.glyphs[codepoint] = (device_width, -height - y_offset, rows)
+
+    def glyph(self, codepoint):
+        glyph = self.glyphs.get(codepoint)
+        if glyph is None:
+            glyph = self.glyphs.get(REPLACEMENT_CODEPOINT)
+        return glyph
+
+    def text_width(self, text):
+        width = 0
+        for c in text:
+            glyph = self.glyph(ord(c))
+            if glyph is not None:
+                width += glyph[0]
+        return width
+
+    def glyph_image(self, codepoint):
+        """The glyph as an "L" mask one font-height tall, top at baseline - self.baseline."""
+        image = self._glyph_images.get(codepoint)
+        if image is None:
+            device_width, top, rows = self.glyph(codepoint)
+            pixels = bytearray(max(device_width, 1) * self.height)
+            for r, mask in enumerate(rows):
+                y = self.baseline + top + r
+                if not 0 <= y < self.height:
+                    continue
+                for x in range(device_width):
+                    if mask >> x & 1:
+                        pixels[y * device_width + x] = 255
+            image = Image.frombytes("L", (max(device_width, 1), self.height), bytes(pixels))
+            self._glyph_images[codepoint] = image
+        return image
+
+
+class TextStrip:
+    """A string rasterized once into an off-screen mask, so scrolling it only
+    costs a blit of the visible window however long the string is."""
+
+    def __init__(self, font, text):
+        self.font = font
+        self.width = font.text_width(text)
+        self.mask = Image.new("L", (max(self.width, 1), font.height))
+        x = 0
+        for c in text:
+            glyph = font.glyph(ord(c))
+            if glyph is None:
+                continue
+            if glyph[0] > 0:
+                self.mask.paste(font.glyph_image(ord(c)), (x, 0))
+            x += glyph[0]
+
+    def draw(self, frame, x, y, color):
+        """Paint the strip onto the RGB image frame with its origin at x and
+        baseline at y, like graphics.DrawText. Returns the strip width."""
+        left = max(0, -x)
+        right = min(self.width, frame.width - x)
+        top = y - self.font.baseline
+        if left < right:
+            window = self.mask.crop((left, 0, right, self.font.height))
+            frame.paste((color.red, color.green, color.blue), (x + left, top), window)
+        return self.width
+
+
+def clear_frame(frame):
+    frame.paste((0, 0, 0), (0, 0, frame.width, frame.height))
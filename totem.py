@@ -1,119 +1,52 @@
 #!/usr/bin/python3
 
-import dbus
+import boot_timer
+
+import itertools
 import threading
-import zlib
 
-from canvas import art_canvas
-from pathlib import Path
-from advertisement import Advertisement
-from service import Application, Service, Characteristic
+from canvas import DELTA_FRAME, art_canvas, parse_stream_message
+import metrics
 from picture import Picture
+from profiler import profiler
 import os
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
 import subprocess
 
 
-GATT_CHRC_IFACE = "org.bluez.GattCharacteristic1"
 DIR = "/home/totem/totem"
+# "werkzeug" (threaded, supports /api/canvas/ws) or "waitress" (production WSGI)
+HTTP_SERVER = os.environ.get("TOTEM_HTTP_SERVER", "werkzeug")
+HTTP_THREADS = int(os.environ.get("TOTEM_HTTP_THREADS", "8"))
 
 
-class TotemAdvertisement(Advertisement):
-    def __init__(self, index):
-        Advertisement.__init__(self, index, "peripheral")
-        self.add_local_name("Totem")
-        self.include_tx_power = True
-
-
-class Command(Characteristic):
-    TOTEM_CHARACTERISTIC_UUID = "00000002-dead-dead-dead-3e5b444bc3c1"
-
-    def __init__(self, service):
-        Characteristic.__init__(
-            self, self.TOTEM_CHARACTERISTIC_UUID, ["read", "write"], service
-        )
-
-    def ReadValue(self, options):
-        text = f"Displaying {self.service.totem.name}"
-        value = []
-        for c in text:
-            value.append(dbus.Byte(c.encode()))
-        return value
-
-    def WriteValue(self, value, options):
-        self.service.totem.run_command(value)
-
-
-class Brightness(Characteristic):
-    TOTEM_CHARACTERISTIC_UUID = "00000003-dead-dead-dead-b12164711e55"  # This is supposed to look like "brightness" in hex characters only
-
-    def __init__(self, service):
-        Characteristic.__init__(
-            self, self.TOTEM_CHARACTERISTIC_UUID, ["read", "write"], service
-        )
-
-    def ReadValue(self, options):
-        text = f"Brightness: {self.service.totem.matrix.brightness}"
-        print(text)
-        value = []
-        for c in text:
-            value.append(dbus.Byte(c.encode()))
-        return value
-
-    def WriteValue(self, value, options):
-        brightness = int("".join([str(x) for x in value]))
-        if brightness > 0 and brightness <= 100:
-            print(f"Changing to brightness: {brightness}")
-            self.service.totem.matrix.brightness = brightness
-            # Repeat code from above, might be necessary every time we call run() again
-            if self.service.totem.thread is not None:
-                self.service.totem.thread.stop()
-                self.service.totem.thread.join()
-            print(
-                f"Changing totem brightness to: {self.service.totem.matrix.brightness}"
-            )
-            self.service.totem.run()
-        else:
-            print(
-                "Please choose a brightness value between 0 and 100, otherwise you will be ignored"
-            )
-
-
-class TotemService(Service):
-    TOTEM_SVC_UUID = "00000001-dead-dead-dead-3e5b444bc3c1"
-
-    def __init__(self, index):
-        self.value = "default"
-
-        Service.__init__(self, index, self.TOTEM_SVC_UUID, True)
-        self.add_characteristic(Command(self))
-        self.add_characteristic(Brightness(self))
-        self.totem = Picture()
-        self.totem.process()
-        self.totem.run()
-
-    def run(self):
-        self.totem.run()
-
+def register_ble(totem):
+    """Register the GATT service and start advertising. dbus and the BLE
+    classes are only imported here, once the panel is already lit."""
+    from service import Application
+    from totem_service import TotemAdvertisement, TotemService
 
-images_path = Path("images/")
-all_img_commands = [(p.name, p.is_dir()) for p in images_path.iterdir()]
-
-
-app = None
-if __name__ == "__main__":
     app = Application()
-    totem_service = TotemService(0)
+    totem_service = TotemService(0, totem)
     app.add_service(totem_service)
     app.register()
 
     adv = TotemAdvertisement(0)
     adv.register()
+    return app, totem_service
+
 
 last_client_timestamp = 0  # Epoch time in milliseconds
+ws_streams = itertools.count(1)  # Canvas stream number for each WebSocket connection
+
+def create_flask_app():
+    from flask import Flask, Response, request, jsonify, send_from_directory
+    from flask_cors import CORS
+
+    try:
+        from flask_sock import Sock
+    except ImportError:
+        Sock = None
 
-def start_flask_app():
     flask_app = Flask(__name__, static_folder="./web/client/dist", static_url_path="")
     CORS(flask_app)
 
@@ -134,12 +67,52 @@ def start_flask_app():
             client_timestamp = int(client_timestamp)
             if client_timestamp < last_client_timestamp:
                 return jsonify({"status": "ok"})
-        last_client_timestamp = client_timestamp
-        blob = zlib.decompress(request.get_data())
-        grid = [list(blob[row * 64 : (row + 1) * 64]) for row in range(64)]
-        art_canvas.update(grid)
+            last_client_timestamp = client_timestamp
+        # Frame ids restart from 1 in every client encoder; Stream-Id tells them apart
+        stream = ("http", request.headers.get("Stream-Id"))
+        frame_id = (stream, request.headers.get("Frame-Id", type=int))
+        if request.headers.get("Frame-Type") == "delta":
+            base_id = request.headers.get("Base-Frame-Id", type=int)
+            if base_id is not None:
+                base_id = (stream, base_id)
+            if not art_canvas.apply_delta_compressed(
+                request.get_data(), base_id, frame_id
+            ):
+                return jsonify({"status": "resync"}), 409
+        elif not art_canvas.update_compressed(request.get_data(), frame_id):
+            return jsonify({"error": "Malformed frame"}), 400
         return jsonify({"status": "ok"})
 
+    if Sock is not None:
+        sock = Sock(flask_app)
+
+        @sock.route("/api/canvas/ws")
+        def canvas_stream(ws):
+            # Binary messages, see canvas.parse_stream_message. Frame ids are
+            # per connection and increasing; stale frames are dropped.
+            stream = ("ws", next(ws_streams))
+            last_frame_id = -1
+            while True:
+                message = ws.receive()
+                if not isinstance(message, (bytes, bytearray)):
+                    continue
+                parsed = parse_stream_message(message)
+                if parsed is None:
+                    continue
+                frame_id, frame_type, base_id, payload = parsed
+                if frame_id <= last_frame_id:
+                    continue
+                last_frame_id = frame_id
+                if frame_type == DELTA_FRAME:
+                    if not art_canvas.apply_delta_compressed(
+                        payload, (stream, base_id), (stream, frame_id)
+                    ):
+                        ws.send("resync")
+                elif not art_canvas.update_compressed(payload, (stream, frame_id)):
+                    ws.send("resync")
+    else:
+        print("flask_sock not installed, /api/canvas/ws is unavailable")
+
     @flask_app.route("/api/hello")
     def hello():
         return "hello"
@@ -149,12 +122,17 @@ def start_flask_app():
         data = request.get_json(force=True)
         if "command" not in data:
             return jsonify({"error": "No command provided"}), 400
-        totem_service.totem.run_command(data["command"])
-        return jsonify({"command": data["command"]})
+        totem_service.totem.commands.submit(data["command"])
+        return jsonify({"command": data["command"]}), 202
 
     @flask_app.route("/api/command", methods=["GET"])
     def current_command():
-        return jsonify({"command": run_redis_cli("GET", "command")})
+        return jsonify(
+            {
+                "command": run_redis_cli("GET", "command"),
+                **totem_service.totem.commands.state(),
+            }
+        )
 
     @flask_app.route("/api/commands", methods=["GET"])
     def list_commands():
@@ -162,11 +140,60 @@ def start_flask_app():
             {
                 "commands": [
                     {"type": "directory" if is_dir else "file", "name": name}
-                    for (name, is_dir) in all_img_commands
+                    for (name, is_dir) in totem_service.totem.assets.top_level
                 ]
             }
         )
 
+    @flask_app.route("/api/metrics", methods=["GET"])
+    def get_metrics():
+        if request.args.get("format") == "json":
+            return jsonify(metrics.snapshot())
+        return Response(metrics.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+    @flask_app.route("/api/snapshot", methods=["GET"])
+    def snapshot():
+        """The current frame as raw RGB332 bytes, row-major, sized by the
+        Width and Height headers. Needs a matrix backend that can read the
+        panel back, except in canvas mode."""
+        totem = totem_service.totem
+        if hasattr(totem.matrix, "snapshot"):
+            data = totem.matrix.snapshot()
+            width, height = totem.matrix.width, totem.matrix.height
+        elif totem.name.lower().strip() == "canvas":
+            data = art_canvas.snapshot()
+            width, height = art_canvas.width, art_canvas.height
+        else:
+            return jsonify({"error": "This matrix backend can't read frames back"}), 404
+        return Response(
+            data,
+            mimetype="application/octet-stream",
+            headers={"Width": str(width), "Height": str(height)},
+        )
+
+    @flask_app.route("/api/profile", methods=["GET"])
+    def profile_status():
+        return jsonify(profiler.status())
+
+    @flask_app.route("/api/profile/start", methods=["POST"])
+    def start_profile():
+        data = request.get_json(force=True, silent=True) or {}
+        interval = data.get("interval")
+        if not profiler.start(float(interval) if interval else None):
+            return jsonify({"error": "Already profiling"}), 409
+        return jsonify(profiler.status())
+
+    @flask_app.route("/api/profile/stop", methods=["POST"])
+    def stop_profile():
+        path = profiler.stop()
+        if path is None:
+            return jsonify({"error": "Not profiling"}), 409
+        return jsonify({"profile": os.path.basename(path), **profiler.status()})
+
+    @flask_app.route("/api/profile/<name>", methods=["GET"])
+    def get_profile(name):
+        return send_from_directory(profiler.output_dir, name, mimetype="text/plain")
+
     @flask_app.route("/", defaults={"path": ""})
     @flask_app.route("/<path:path>")
     def serve(path):
@@ -179,13 +206,41 @@ def start_flask_app():
         # either “/” or missing file → serve index.html
         return send_from_directory(flask_app.static_folder, "index.html")
 
-    flask_app.run("0.0.0.0", port=80, debug=False)
+    return flask_app
 
 
-if __name__ == "__main__" and app is not None:
+def start_flask_app(server=HTTP_SERVER):
+    flask_app = create_flask_app()
+    if server == "waitress":
+        try:
+            import waitress
+        except ImportError:
+            print("waitress not installed, falling back to the werkzeug server")
+        else:
+            print(
+                f"Serving with waitress ({HTTP_THREADS} threads), /api/canvas/ws is unavailable"
+            )
+            waitress.serve(flask_app, host="0.0.0.0", port=80, threads=HTTP_THREADS)
+            return
+    flask_app.run("0.0.0.0", port=80, debug=False, threaded=True)
+
+
+if __name__ == "__main__":
+    boot_timer.mark("imports")
+    # First pixel before anything else: BLE and HTTP can wait
+    totem = Picture()
+    boot_timer.mark("picture")
+    totem.process()
+    boot_timer.mark("matrix")
+    totem.run()
+    boot_timer.mark("first frame")
+    app, totem_service = register_ble(totem)
+    boot_timer.mark("ble")
     thread = threading.Thread(target=start_flask_app)
     try:
         thread.start()
+        boot_timer.mark("http thread")
+        boot_timer.report()
         app.run()
     except KeyboardInterrupt:
         app.quit()
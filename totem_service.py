@@ -0,0 +1,99 @@
+import dbus
+
+import metrics
+from profiler import profiler
+from advertisement import Advertisement
+from service import Service, Characteristic
+
+
+class TotemAdvertisement(Advertisement):
+    def __init__(self, index):
+        Advertisement.__init__(self, index, "peripheral")
+        self.add_local_name("Totem")
+        self.include_tx_power = True
+
+
+class Command(Characteristic):
+    TOTEM_CHARACTERISTIC_UUID = "00000002-dead-dead-dead-3e5b444bc3c1"
+
+    def __init__(self, service):
+        Characteristic.__init__(
+            self, self.TOTEM_CHARACTERISTIC_UUID, ["read", "write"], service
+        )
+
+    def ReadValue(self, options):
+        text = f"Displaying {self.service.totem.name}"
+        pending = self.service.totem.commands.state()["pending"]
+        if pending is not None:
+            text += f" (next: {pending})"
+        value = []
+        for c in text:
+            value.append(dbus.Byte(c.encode()))
+        return value
+
+    def WriteValue(self, value, options):
+        text = "".join([str(x) for x in value])
+        if text == "profile:start":
+            profiler.start()
+        elif text == "profile:stop":
+            profiler.stop()
+        else:
+            self.service.totem.commands.submit(text)
+
+
+class Brightness(Characteristic):
+    TOTEM_CHARACTERISTIC_UUID = "00000003-dead-dead-dead-b12164711e55"  # This is supposed to look like "brightness" in hex characters only
+
+    def __init__(self, service):
+        Characteristic.__init__(
+            self, self.TOTEM_CHARACTERISTIC_UUID, ["read", "write"], service
+        )
+
+    def ReadValue(self, options):
+        text = f"Brightness: {self.service.totem.matrix.brightness}"
+        print(text)
+        value = []
+        for c in text:
+            value.append(dbus.Byte(c.encode()))
+        return value
+
+    def WriteValue(self, value, options):
+        brightness = int("".join([str(x) for x in value]))
+        if brightness > 0 and brightness <= 100:
+            print(f"Changing totem brightness to: {brightness}")
+            # Fades the running mode in place, no restart or re-decode
+            self.service.totem.ramp_brightness(brightness)
+        else:
+            print(
+                "Please choose a brightness value between 0 and 100, otherwise you will be ignored"
+            )
+
+
+class Metrics(Characteristic):
+    TOTEM_CHARACTERISTIC_UUID = "00000004-dead-dead-dead-00003e7a1c55"  # "metrics", give or take
+
+    def __init__(self, service):
+        Characteristic.__init__(self, self.TOTEM_CHARACTERISTIC_UUID, ["read"], service)
+
+    def ReadValue(self, options):
+        value = []
+        for c in metrics.summary():
+            value.append(dbus.Byte(c.encode()))
+        return value
+
+
+class TotemService(Service):
+    TOTEM_SVC_UUID = "00000001-dead-dead-dead-3e5b444bc3c1"
+
+    def __init__(self, index, totem):
+        self.value = "default"
+
+        Service.__init__(self, index, self.TOTEM_SVC_UUID, True)
+        self.add_characteristic(Command(self))
+        self.add_characteristic(Brightness(self))
+        self.add_characteristic(Metrics(self))
+        # Already showing its first frame; BLE only comes up after that
+        self.totem = totem
+
+    def run(self):
+        self.totem.run()
@@ -1,13 +1,25 @@
-import { sendCanvas } from "./api";
+import { CanvasSocket, sendCanvas } from "./api";
 import { useInterval } from "./useInterval";
 import { encodeRgb332 } from "./api";
 import { IS_DEV } from "./constants";
-import React from "react";
+import React, { useEffect, useRef } from "react";
 
 // @ts-ignore
 export const Canvas = React.forwardRef((_, ref: React.RefObject<HTMLCanvasElement | null>) => {
   const W = 64;
   const H = 64;
+  const socketRef = useRef<CanvasSocket | null>(null);
+  useEffect(() => {
+    if (IS_DEV) {
+      return;
+    }
+    const socket = new CanvasSocket();
+    socketRef.current = socket;
+    return () => {
+      socket.close();
+      socketRef.current = null;
+    };
+  }, []);
   useInterval(
     () => {
       if (ref.current == null) {
@@ -22,7 +34,7 @@ export const Canvas = React.forwardRef((_, ref: React.RefObject<HTMLCanvasElemen
       const imgData = ctx.getImageData(0, 0, W, H);
       const flat = imgData.data;
       const rgb332 = encodeRgb332(flat);
-      if (!IS_DEV) {
+      if (!IS_DEV && !socketRef.current?.send(rgb332)) {
         sendCanvas(rgb332);
       }
     },
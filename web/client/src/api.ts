@@ -1,20 +1,199 @@
 import pako from "pako";
 import { IS_DEV } from "./constants";
 
+export const FULL_FRAME = 0;
+export const DELTA_FRAME = 1;
+const SPAN_HEADER_BYTES = 4;
+
+/**
+ * Spans of bytes that differ between prev and next, encoded as
+ * [offset u16][length u16][bytes...] repeated. Runs of unchanged bytes shorter
+ * than a span header are folded into the surrounding span.
+ * @returns null if the frames are identical
+ */
+export function encodeDelta(prev: Uint8Array, next: Uint8Array): Uint8Array | null {
+  const spans: [number, number][] = [];
+  let i = 0;
+  while (i < next.length) {
+    if (prev[i] === next[i]) {
+      i++;
+      continue;
+    }
+    const start = i;
+    let end = i + 1;
+    let j = end;
+    while (j < next.length && j - end < SPAN_HEADER_BYTES) {
+      if (prev[j] !== next[j]) {
+        end = j + 1;
+      }
+      j++;
+    }
+    spans.push([start, end]);
+    i = end;
+  }
+  if (spans.length === 0) {
+    return null;
+  }
+
+  let size = 0;
+  for (const [start, end] of spans) {
+    size += SPAN_HEADER_BYTES + end - start;
+  }
+  const out = new Uint8Array(size);
+  const view = new DataView(out.buffer);
+  let pos = 0;
+  for (const [start, end] of spans) {
+    view.setUint16(pos, start);
+    view.setUint16(pos + 2, end - start);
+    out.set(next.subarray(start, end), pos + SPAN_HEADER_BYTES);
+    pos += SPAN_HEADER_BYTES + end - start;
+  }
+  return out;
+}
+
+export type EncodedFrame = {
+  id: number;
+  type: typeof FULL_FRAME | typeof DELTA_FRAME;
+  baseId: number;
+  payload: Uint8Array;
+};
+
+/**
+ * Turns successive canvas frames into a full frame followed by deltas against
+ * the previously sent frame. Call resync() when the server rejects a delta.
+ * Frame ids start from 1 in every encoder; streamId tells encoders apart.
+ */
+export class FrameEncoder {
+  readonly streamId = crypto.getRandomValues(new Uint32Array(1))[0].toString(16);
+  private prev: Uint8Array | null = null;
+  private prevId = 0;
+
+  encode(flat: Uint8Array): EncodedFrame | null {
+    const id = this.prevId + 1;
+    let frame: EncodedFrame;
+    if (this.prev == null) {
+      frame = { id, type: FULL_FRAME, baseId: 0, payload: pako.deflate(flat) };
+    } else {
+      const delta = encodeDelta(this.prev, flat);
+      if (delta == null) {
+        return null;
+      }
+      frame = { id, type: DELTA_FRAME, baseId: this.prevId, payload: pako.deflate(delta) };
+    }
+    this.prev = flat.slice();
+    this.prevId = id;
+    return frame;
+  }
+
+  resync() {
+    this.prev = null;
+  }
+}
+
+const httpEncoder = new FrameEncoder();
+
 export const sendCanvas = async (flat: Uint8Array) => {
-  const deflated = pako.deflate(flat);
-  await fetch(baseUrl + "/api/canvas", {
+  const frame = httpEncoder.encode(flat);
+  if (frame == null) {
+    return;
+  }
+  const headers: Record<string, string> = {
+    "Content-Type": "application/octet-stream",
+    "Client-Timestamp": Date.now().toString(),
+    "Stream-Id": httpEncoder.streamId,
+    "Frame-Id": frame.id.toString(),
+  };
+  if (frame.type === DELTA_FRAME) {
+    headers["Frame-Type"] = "delta";
+    headers["Base-Frame-Id"] = frame.baseId.toString();
+  }
+  const response = await fetch(baseUrl + "/api/canvas", {
     method: "POST",
-    headers: {
-      "Content-Type": "application/octet-stream",
-      "Client-Timestamp": Date.now().toString(),
-    },
-    body: deflated,
+    headers,
+    body: frame.payload,
   });
+  if (response.status === 409) {
+    httpEncoder.resync();
+  }
 };
 
 export const baseUrl = IS_DEV ? "http://localhost" : "http://totem.local";
 
+/**
+ * Long-lived binary channel for streaming canvas frames. Each message is
+ * [frame id u32][frame type u8][base frame id u32, deltas only] followed by
+ * the deflated payload, big-endian. Frame ids are scoped to the connection. The
+ * server replies "resync" when it can't apply a delta. Reconnects automatically; send() returns false while
+ * disconnected so the caller can fall back to sendCanvas.
+ */
+export class CanvasSocket {
+  private ws: WebSocket | null = null;
+  private encoder = new FrameEncoder();
+  private closed = false;
+  private url: string;
+
+  constructor(url = baseUrl.replace(/^http/, "ws") + "/api/canvas/ws") {
+    this.url = url;
+    this.connect();
+  }
+
+  private connect() {
+    const ws = new WebSocket(this.url);
+    ws.binaryType = "arraybuffer";
+    ws.onopen = () => {
+      if (this.closed) {
+        ws.close();
+        return;
+      }
+      this.ws = ws;
+      this.encoder = new FrameEncoder();
+    };
+    ws.onmessage = (event) => {
+      if (event.data === "resync") {
+        this.encoder.resync();
+      }
+    };
+    ws.onclose = () => {
+      this.ws = null;
+      if (!this.closed) {
+        setTimeout(() => this.connect(), 1000);
+      }
+    };
+    ws.onerror = () => ws.close();
+  }
+
+  send(flat: Uint8Array): boolean {
+    const ws = this.ws;
+    if (ws == null || ws.readyState !== WebSocket.OPEN) {
+      return false;
+    }
+    // Drop the frame rather than queueing behind a slow link
+    if (ws.bufferedAmount > 0) {
+      return true;
+    }
+    const frame = this.encoder.encode(flat);
+    if (frame == null) {
+      return true;
+    }
+    const headerSize = frame.type === DELTA_FRAME ? 9 : 5;
+    const message = new Uint8Array(headerSize + frame.payload.length);
+    const view = new DataView(message.buffer);
+    view.setUint32(0, frame.id);
+    view.setUint8(4, frame.type);
+    if (frame.type === DELTA_FRAME) {
+      view.setUint32(5, frame.baseId);
+    }
+    message.set(frame.payload, headerSize);
+    ws.send(message);
+    return true;
+  }
+
+  close() {
+    this.closed = true;
+    this.ws?.close();
+  }
+}
+
 export const changeCommand = async (command: string) => {
   await fetch(baseUrl + "/api/command", {
     method: "POST",